@@ -0,0 +1,33 @@
+import os
+
+from app.config import Config
+
+import uvicorn
+
+conf = Config()
+
+
+def run():
+    """Run the API with one pre-forked process per worker
+
+    Every worker imports ``app.business.main`` on its own, so each one
+    gets its own Motor pool and Kafka producer. Uvicorn drains in-flight
+    requests on SIGTERM and the shutdown hook flushes the producer.
+    """
+    workers = conf.server_workers or os.cpu_count() or 1
+    uvicorn.run(
+        "app.business.main:app",
+        host=conf.server_host,
+        port=conf.server_port,
+        workers=workers,
+        backlog=conf.server_backlog,
+        timeout_keep_alive=conf.server_keep_alive,
+        limit_concurrency=conf.server_limit_concurrency,
+        loop=conf.server_loop,
+        http=conf.server_http,
+        log_level="info",
+    )
+
+
+if __name__ == "__main__":
+    run()
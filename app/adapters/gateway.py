@@ -1,6 +1,6 @@
-from typing import Any, List
-from datetime import datetime
-from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from dataclasses import dataclass, field
 
 from app.entities.models import (
     QuoterDictModel,
@@ -8,40 +8,149 @@ from app.entities.models import (
     SellDictModel,
     QuoterModel,
     MessageType,
-    QuoterIdModel
+    QuoterIdModel,
+    QuoterPageModel,
+    QuoterQueryModel,
+    from_document
 )
 from app.config import Config
+from app.profiling import profile_spans
 from app.adapters.gateway_i import GatewayInterface
 from app.infrastructure.repository_i import RepositoryInterface
+from app.infrastructure.pending_writes import PendingWrites
 from app.errors import SaleRelatedError, ElementNotFoundError
 
 from pydantic import BaseSettings
 from fastapi.encoders import jsonable_encoder
 
 
+def matches_content(quoter: Dict[str, Any], content: str) -> bool:
+    # A literal case insensitive match, the search string is never run as
+    # a pattern in the event loop. Plain words match as in the Mongo search
+    content = content.casefold()
+    texts = [
+        quoter.get("name"),
+        quoter.get("description"),
+        *(service.get("name") for service in quoter.get("services") or []),
+        *(product.get("title") for product in quoter.get("products") or [])
+    ]
+    return any(
+        isinstance(text, str) and content in text.casefold()
+        for text in texts
+    )
+
+
+@profile_spans
 @dataclass
 class Gateway(GatewayInterface):
 
     repository: RepositoryInterface
     conf: BaseSettings = Config()
+    pending_writes: PendingWrites = field(init=False)
+
+    def __post_init__(self):
+        # Published but maybe not persisted writes, only used when the
+        # stream consumer is the one writing in DB. They are kept per
+        # process, with several workers a read only sees the writes done
+        # by the worker serving it
+        self.pending_writes = PendingWrites(
+            self.conf.pending_writes_ttl_seconds,
+            self.conf.pending_writes_max_entries
+        )
+
+    def _merge_pending(
+        self,
+        quoters: List[QuoterDictModel],
+        pending: List[QuoterDictModel]
+    ) -> List[QuoterDictModel]:
+        found = {quoter["_id"] for quoter in quoters}
+        observe = self.pending_writes.observe_quoter
+        return [
+            *(observe(quoter) for quoter in quoters),
+            *(quoter for quoter in pending if quoter["_id"] not in found)
+        ]
+
+    async def _find_sell_by_quoter(self, quoter_id: str) -> SellDictModel:
+        try:
+            sale = await self.repository.find_sell_by_quoter(quoter_id)
+        except ElementNotFoundError:
+            if not self.conf.stream_consume:
+                raise
+            pending = self.pending_writes.sale_by_quoter(quoter_id)
+            if pending is None:
+                raise
+            return pending
+        if self.conf.stream_consume:
+            self.pending_writes.observe_sale(quoter_id)
+        return sale
+
+    async def create_indexes(self):
+        await self.repository.create_indexes()
 
     async def search_quoter_by_content(
         self,
         content: str
     ) -> List[QuoterDictModel]:
-        return await self.repository.search_quoter_by_content(content)
+        quoters = await self.repository.search_quoter_by_content(content)
+        if not self.conf.stream_consume:
+            return quoters
+        pending = [
+            quoter
+            for quoter in self.pending_writes.quoters()
+            if matches_content(quoter, content)
+        ]
+        return self._merge_pending(quoters, pending)
 
     async def get_quoters(self) -> List[QuoterModel]:
-        return await self.repository.get_quoters()
+        if not self.conf.stream_consume:
+            return await self.repository.get_quoters()
+        pending = self.pending_writes.quoters()
+        try:
+            quoters = await self.repository.get_quoters()
+        except ElementNotFoundError:
+            if not pending:
+                raise
+            quoters = []
+        return self._merge_pending(quoters, pending)
 
-    async def get_quoter(self, quoter_id: str) -> QuoterDictModel:
-        return await self.repository.get_quoter(quoter_id)
+    async def query_quoters(self, query: QuoterQueryModel) -> QuoterPageModel:
+        quoters = await self.repository.query_quoters(query)
+        page_size = min(query.page_size, self.conf.max_search_elements)
+        return QuoterPageModel(
+            quoters=quoters[:page_size],
+            page=query.page,
+            page_size=page_size,
+            has_next=quoters.__len__() > page_size
+        )
+
+    async def get_quoter(
+        self,
+        quoter_id: str,
+        include_archived: bool = False
+    ) -> QuoterDictModel:
+        try:
+            quoter = await self.repository.get_quoter(
+                quoter_id,
+                include_archived
+            )
+        except ElementNotFoundError:
+            if not self.conf.stream_consume:
+                raise
+            pending = self.pending_writes.quoter(quoter_id)
+            if pending is None:
+                raise
+            return pending
+        if self.conf.stream_consume:
+            return self.pending_writes.observe_quoter(quoter)
+        return quoter
 
     async def insert_quoter(self, quoter: QuoterModel) -> QuoterDictModel:
+        quoter = quoter.copy(update={"updated_at": datetime.utcnow()})
         if self.conf.stream_consume:
             product_type = MessageType.quoter
             await self.repository.notify(quoter, product_type)
             response = jsonable_encoder(quoter)
+            self.pending_writes.add_quoter(response)
         else:
             response = await self.repository.insert_quoter(quoter)
         return response
@@ -52,19 +161,32 @@ class Gateway(GatewayInterface):
         quoter: Any
     ) -> QuoterDictModel:
         try:
-            await self.repository.find_sell_by_quoter(quoter_id)
+            await self._find_sell_by_quoter(quoter_id)
         except ElementNotFoundError:
             if self.conf.stream_consume:
-                quoter_got = await self.repository.get_quoter(quoter_id)
-                quoter_model = QuoterModel(**quoter_got)
+                quoter_got = await self.get_quoter(quoter_id)
+                quoter_model = from_document(QuoterModel, quoter_got)
                 new_quoter_data = quoter.dict(exclude_unset=True)
-                updated_quoter = quoter_model.copy(update=new_quoter_data)
+                updated_quoter = quoter_model.copy(
+                    update={
+                        **new_quoter_data,
+                        "updated_at": datetime.utcnow()
+                    }
+                )
+                # Build the nested models from the already validated update
+                # data, so the published event and the pending write share
+                # the same nested ids
+                updated_quoter = from_document(
+                    QuoterModel,
+                    jsonable_encoder(updated_quoter)
+                )
                 quoter_type = MessageType.quoter
                 await self.repository.notify(
                     updated_quoter,
                     quoter_type
                 )
                 updated_quoter = jsonable_encoder(updated_quoter)
+                self.pending_writes.add_quoter(updated_quoter)
             else:
                 await self.repository.update_quoter(
                     quoter_id,
@@ -85,6 +207,20 @@ class Gateway(GatewayInterface):
             product_type = MessageType.sell
             await self.repository.notify(sell, product_type)
             response = jsonable_encoder(sell)
+            self.pending_writes.add_sale(response)
         else:
             response = await self.repository.create_sell(sell)
         return response
+
+    async def archive_quoters(
+        self,
+        now: datetime,
+        sold_after: Optional[datetime] = None
+    ) -> int:
+        older_than = now - timedelta(days=self.conf.archive_after_days)
+        sold_before = now - timedelta(days=self.conf.archive_sold_after_days)
+        return await self.repository.archive_quoters(
+            older_than.isoformat(),
+            sold_before.isoformat(),
+            sold_after.isoformat() if sold_after else None
+        )
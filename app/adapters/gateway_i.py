@@ -1,9 +1,13 @@
-from typing import Any, List
+from typing import Any, List, Optional
 from abc import ABC, abstractmethod
 
 
 class GatewayInterface(ABC):
 
+    @abstractmethod
+    async def create_indexes(self):
+        """Create the indexes used by the quoter and sale queries"""
+
     @abstractmethod
     async def search_quoter_by_content(self, content: str) -> List[Any]:
         """Search a quoter by the content of it
@@ -24,11 +28,27 @@ class GatewayInterface(ABC):
         """
 
     @abstractmethod
-    async def get_quoter(self, quoter_id: str) -> Any:
+    async def query_quoters(self, query: Any) -> Any:
+        """Get a page of quoters matching the structured filters
+
+        Args:
+            query (Any): filters, sort and page to get
+
+        Returns:
+            Any: quoters of the page and whether there is a next one
+        """
+
+    @abstractmethod
+    async def get_quoter(
+        self,
+        quoter_id: str,
+        include_archived: bool = False
+    ) -> Any:
         """Word to search into product catalog
 
         Args:
             quoter_id (str): quoter id to find
+            include_archived (bool): look into the archive on a miss
 
         Returns:
             Any: Quoter information found
@@ -65,3 +85,19 @@ class GatewayInterface(ABC):
             quoter_id (str): quoter to mark as a sell
 
         """
+
+    @abstractmethod
+    async def archive_quoters(
+        self,
+        now: Any,
+        sold_after: Optional[Any] = None
+    ) -> int:
+        """Move quoters past the configured ages to the archive
+
+        Args:
+            now (Any): moment the ages are counted from
+            sold_after (Optional[Any]): skip sales before this date
+
+        Returns:
+            int: number of quoters archived
+        """
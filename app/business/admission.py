@@ -0,0 +1,84 @@
+import heapq
+import asyncio
+import itertools
+from enum import Enum
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from app.errors import OverloadedError
+
+
+class RouteClass(Enum):
+    write = 0
+    read = 1
+    search = 2
+
+
+@dataclass
+class AdmissionController:
+    """Bound the requests being processed and the ones waiting for a slot
+
+    Waiting requests are admitted by route class priority (writes before
+    reads before searches) and every class can have its own concurrency
+    limit on top of the global one.
+    """
+
+    concurrency: int
+    max_queue: int
+    max_wait: float
+    class_limits: Dict[RouteClass, int] = field(default_factory=dict)
+    _active: Dict[RouteClass, int] = field(
+        default_factory=lambda: {route: 0 for route in RouteClass}
+    )
+    _waiters: List[Tuple[int, int, RouteClass, asyncio.Future]] = field(
+        default_factory=list
+    )
+    _sequence: itertools.count = field(default_factory=itertools.count)
+
+    def _can_run(self, route: RouteClass) -> bool:
+        if sum(self._active.values()) >= self.concurrency:
+            return False
+        limit = self.class_limits.get(route)
+        return limit is None or self._active[route] < limit
+
+    async def acquire(self, route: RouteClass):
+        if self._can_run(route):
+            self._active[route] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise OverloadedError("Admission queue is full")
+        future = asyncio.get_running_loop().create_future()
+        waiter = (route.value, next(self._sequence), route, future)
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # Admitted right at the deadline, give the slot back
+                self.release(route)
+            else:
+                future.cancel()
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise OverloadedError("Timed out waiting for admission")
+
+    def release(self, route: RouteClass):
+        self._active[route] -= 1
+        self._wake_up()
+
+    def _wake_up(self):
+        skipped = []
+        while self._waiters and sum(self._active.values()) < self.concurrency:
+            waiter = heapq.heappop(self._waiters)
+            _, _, route, future = waiter
+            if future.done():
+                continue
+            if not self._can_run(route):
+                skipped.append(waiter)
+                continue
+            self._active[route] += 1
+            future.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
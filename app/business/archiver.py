@@ -0,0 +1,57 @@
+import signal
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from app.config import Config
+from app.connections import create_connection
+from app.infrastructure.repository import Repository
+from app.adapters.gateway import Gateway
+
+conf = Config()
+log = logging.getLogger(__name__)
+
+
+async def archive():
+    """Move old and sold quoters to the archive every interval
+
+    Meant to run as a single process, apart from the API workers, so only
+    one archiver moves the hot quoters at a time.
+    """
+    gateway = Gateway(Repository(create_connection(), None))
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stopping.set)
+    # Sales before this date were already walked by a previous run. It
+    # only moves forward after a run that archived every sold quoter, a
+    # failed run walks the same sales again
+    sold_after = None
+    while not stopping.is_set():
+        now = datetime.utcnow()
+        try:
+            archived = await gateway.archive_quoters(now, sold_after)
+        except Exception as e:
+            log.error(f"Could not archive quoters: {e}")
+        else:
+            log.info(f"Archived {archived} quoters")
+            sold_after = now - timedelta(days=conf.archive_sold_after_days)
+        try:
+            await asyncio.wait_for(
+                stopping.wait(),
+                conf.archive_interval_seconds
+            )
+        except asyncio.TimeoutError:
+            pass
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if not conf.archive_quoters_collec:
+        log.error("archive_quoters_collec is not configured")
+        return
+    asyncio.run(archive())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import json
+import signal
+import asyncio
+import logging
+import multiprocessing
+from typing import Dict, List, Tuple
+
+from app.config import Config
+from app.connections import create_connection, create_consumer
+from app.infrastructure.repository import Repository
+from app.entities.models import (
+    MessageType,
+    QuoterModel,
+    SellModel,
+    from_document
+)
+from app.errors import InsertionError, OverloadedError
+
+from fastapi.encoders import jsonable_encoder
+from confluent_kafka import Consumer, KafkaException, Message, TopicPartition
+
+conf = Config()
+log = logging.getLogger(__name__)
+EVENT_MODELS = {
+    MessageType.quoter.value: QuoterModel,
+    MessageType.sell.value: SellModel,
+}
+
+
+def decode_events(messages: List[Message]) -> Tuple[List[dict], List[dict]]:
+    """Decode a batch of events into the documents to write
+
+    Only the last event of every quoter or sale in the batch is kept, so
+    the unordered bulk write can not apply an older version last.
+
+    Args:
+        messages (List[Message]): messages consumed from kafka_topic
+
+    Returns:
+        Tuple[List[dict], List[dict]]: quoters and sales documents
+    """
+    latest: Dict[str, Dict[str, dict]] = {
+        event_type: {} for event_type in EVENT_MODELS
+    }
+    for message in messages:
+        if message.error():
+            log.error(f"Could not consume a message: {message.error()}")
+            continue
+        try:
+            event = json.loads(message.value())
+            content = event["content"]
+            if "id" not in content and "_id" not in content:
+                raise KeyError("id")
+            # Events are published by this service, no need to validate
+            document = jsonable_encoder(
+                from_document(EVENT_MODELS[event["type"]], content)
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            log.error(
+                f"Could not decode the event at {message.topic()}"
+                f"[{message.partition()}]@{message.offset()}: {e}"
+            )
+            continue
+        latest[event["type"]][document["_id"]] = document
+    return (
+        list(latest[MessageType.quoter.value].values()),
+        list(latest[MessageType.sell.value].values())
+    )
+
+
+def rewind(consumer: Consumer, messages: List[Message]):
+    """Seek back to the first message of the batch on every partition"""
+    first_offsets: Dict[Tuple[str, int], int] = {}
+    for message in messages:
+        if message.error():
+            continue
+        partition = (message.topic(), message.partition())
+        first_offsets[partition] = min(
+            first_offsets.get(partition, message.offset()),
+            message.offset()
+        )
+    for (topic, partition), offset in first_offsets.items():
+        try:
+            consumer.seek(TopicPartition(topic, partition, offset))
+        except KafkaException as e:
+            # Usually a rebalance took the partition away. Subscribing
+            # again restarts every partition from its committed offset,
+            # which is never past the start of the batch
+            log.warning(f"Could not rewind {topic}[{partition}]: {e}")
+            resubscribe(consumer)
+            return
+
+
+def resubscribe(consumer: Consumer):
+    try:
+        consumer.unsubscribe()
+        consumer.subscribe([conf.kafka_topic])
+    except KafkaException as e:
+        log.error(f"Could not subscribe again to {conf.kafka_topic}: {e}")
+
+
+async def apply_messages(
+    consumer: Consumer,
+    repository: Repository,
+    messages: List[Message]
+) -> bool:
+    """Write a batch of messages and commit their offsets
+
+    Returns:
+        bool: whether the batch was written, otherwise the consumer is
+            rewound to the start of the batch
+    """
+    quoters, sales = decode_events(messages)
+    try:
+        await repository.upsert_events(quoters, sales)
+    except (InsertionError, OverloadedError) as e:
+        log.error(f"Could not apply the events: {e}")
+        rewind(consumer, messages)
+        return False
+    try:
+        consumer.commit(asynchronous=False)
+    except KafkaException as e:
+        log.error(f"Could not commit the offsets: {e}")
+    log.info(f"Applied {len(quoters)} quoters and {len(sales)} sales")
+    return True
+
+
+async def consume(
+    consumer: Consumer,
+    repository: Repository,
+    stopping: asyncio.Event
+):
+    while not stopping.is_set():
+        messages = await asyncio.to_thread(
+            consumer.consume,
+            conf.consumer_batch_size,
+            conf.consumer_poll_timeout
+        )
+        if not messages:
+            continue
+        if not await apply_messages(consumer, repository, messages):
+            await asyncio.sleep(conf.consumer_retry_seconds)
+
+
+async def run():
+    consumer = create_consumer()
+    consumer.subscribe([conf.kafka_topic])
+    repository = Repository(create_connection(), None)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stopping.set)
+    try:
+        await consume(consumer, repository, stopping)
+    finally:
+        consumer.close()
+
+
+def run_worker():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run())
+
+
+def main():
+    """Run consumer_processes workers in the same consumer group
+
+    Kafka assigns the partitions of kafka_topic among all the workers of
+    the group, so more processes (here or in other hosts) scale out up to
+    one per partition. Events are keyed by quoter id (sales by their
+    quoter_id), so all the events of a quoter are in one partition and
+    are applied in the order they were published, whatever the number of
+    workers.
+    """
+    if conf.consumer_processes <= 1:
+        run_worker()
+        return
+    workers = [
+        multiprocessing.Process(target=run_worker)
+        for _ in range(conf.consumer_processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def stop(signal_number, frame):
+        for worker in workers:
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,54 @@
+import hmac
+import json
+import time
+import hashlib
+import random
+import asyncio
 import logging
+import threading
 from typing import Optional
 
 from app.config import Config
-from app.connections import create_connection, create_producer
+from app.profiling import (
+    Profile,
+    ProfileStore,
+    StackSampler,
+    current_profile
+)
+from app.connections import (
+    create_connection,
+    create_producer,
+    pool_monitor
+)
 from app.infrastructure.repository import Repository
 from app.adapters.gateway import Gateway
+from app.infrastructure.idempotency import IdempotencyStore
+from app.business.admission import AdmissionController, RouteClass
 from app.entities.models import (
     QuoterIdModel,
     QuoterModel,
+    QuoterQueryModel,
     QuoterUpdateModel
 )
 
 from app.errors import (
     ElementNotFoundError,
     DBConnectionError,
+    IdempotencyKeyError,
+    OverloadedError,
     SaleRelatedError
 )
 
 import uvicorn
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+    status
+)
 
 conf = Config()
 app = FastAPI()
@@ -32,6 +61,158 @@ gateway = Gateway(
         messaging_conn
     )
 )
+idempotency_store = IdempotencyStore(
+    conf.idempotency_ttl_seconds,
+    conf.idempotency_max_keys,
+    nosql_connection[conf.idempotency_collec]
+    if conf.idempotency_collec else None,
+    conf.idempotency_claim_seconds,
+    conf.idempotency_poll_interval
+)
+
+admission = AdmissionController(
+    conf.admission_concurrency,
+    conf.admission_max_queue,
+    conf.admission_max_wait,
+    {
+        route: limit
+        for route, limit in (
+            (RouteClass.read, conf.admission_read_concurrency),
+            (RouteClass.search, conf.admission_search_concurrency)
+        )
+        if limit is not None
+    }
+)
+profile_store = ProfileStore(
+    conf.profiling_dir,
+    conf.profiling_max_profiles
+)
+QUOTERS_PATH = "/api/v1/quoters"
+PROFILES_PATH = "/api/v1/profiles"
+PROFILE_TOKEN_HEADER = "x-profile-token"
+QUOTERS_QUERY_PATH = "/api/v1/quoters/query"
+
+
+def get_route_class(request: Request) -> Optional[RouteClass]:
+    if not request.url.path.startswith("/api/"):
+        return None
+    if request.method in ("POST", "PATCH"):
+        return RouteClass.write
+    if request.url.path.rstrip("/") in (QUOTERS_PATH, QUOTERS_QUERY_PATH):
+        return RouteClass.search
+    return RouteClass.read
+
+
+def check_saturation(route: RouteClass):
+    pool_wait = pool_monitor.recent_wait()
+    if pool_wait > conf.max_pool_wait_seconds:
+        raise OverloadedError(f"Mongo pool wait is {pool_wait:.3f}s")
+    if route is RouteClass.write and (
+        len(messaging_conn) > conf.kafka_max_queue_depth
+    ):
+        raise OverloadedError(
+            f"Kafka queue depth is {len(messaging_conn)}"
+        )
+
+
+def overloaded_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service overloaded, try again later"},
+        headers={"Retry-After": str(conf.admission_retry_after)}
+    )
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    route = get_route_class(request)
+    if route is None:
+        return await call_next(request)
+    try:
+        check_saturation(route)
+        await admission.acquire(route)
+    except OverloadedError as e:
+        log.warning(f"Request rejected by admission control: {e}")
+        return overloaded_response()
+    try:
+        return await call_next(request)
+    finally:
+        admission.release(route)
+
+
+def is_profiling_token(token: Optional[str]) -> bool:
+    if not conf.profiling_token or not token:
+        return False
+    return hmac.compare_digest(token, conf.profiling_token)
+
+
+def should_profile(request: Request) -> bool:
+    path = request.url.path
+    if not path.startswith("/api/") or path.startswith(PROFILES_PATH):
+        return False
+    if is_profiling_token(request.headers.get(PROFILE_TOKEN_HEADER)):
+        return True
+    return random.random() < conf.profiling_sample_rate
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    if not should_profile(request):
+        return await call_next(request)
+    profile = Profile(request.method, request.url.path)
+    sampler = StackSampler(threading.get_ident(), conf.profiling_interval)
+    context_token = current_profile.set(profile)
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        sampler.stop()
+        current_profile.reset(context_token)
+        profile.duration = time.perf_counter() - started
+        profile.stacks = sampler.collapsed()
+        for span in profile.spans:
+            span["start"] -= started
+        try:
+            await asyncio.to_thread(profile_store.save, profile)
+        except OSError as e:
+            log.error(f"Could not store the profile: {e}")
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+@app.on_event("startup")
+async def create_indexes():
+    await idempotency_store.create_indexes()
+    await gateway.create_indexes()
+
+
+async def poll_producer():
+    # Serves the delivery callbacks of the messages produced by notify
+    while True:
+        await asyncio.to_thread(messaging_conn.poll, 0.1)
+
+
+@app.on_event("startup")
+async def start_producer_poller():
+    app.state.producer_poller = asyncio.create_task(poll_producer())
+
+
+@app.on_event("shutdown")
+async def drain_producer():
+    app.state.producer_poller.cancel()
+    pending = await asyncio.to_thread(
+        messaging_conn.flush,
+        conf.kafka_flush_timeout
+    )
+    if pending:
+        log.error(f"Could not deliver {pending} messages before shutdown")
+
+
+async def get_body_hash(request: Request) -> str:
+    # Canonical JSON, so retries are matched whatever the key order
+    body = json.dumps(await request.json(), sort_keys=True)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
 
 
 async def get_quoters():
@@ -43,6 +224,9 @@ async def get_quoters():
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could not find the quoters"
         )
+    except OverloadedError as e:
+        log.error(f"Service overloaded: {e}")
+        return overloaded_response()
     except Exception as e:
         log.error(f"Could not find the quoter: {e}")
         raise HTTPException(
@@ -64,6 +248,9 @@ async def search_quoter_by_content(content: Optional[str] = None):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could not find a quoter"
         )
+    except OverloadedError as e:
+        log.error(f"Service overloaded: {e}")
+        return overloaded_response()
     except Exception as e:
         log.error(f"Could not find a quoter: {e}")
         raise HTTPException(
@@ -78,16 +265,74 @@ async def search_quoter_by_content(content: Optional[str] = None):
     return quoter
 
 
+@app.get(QUOTERS_QUERY_PATH)
+async def query_quoters(query: QuoterQueryModel = Depends()):
+    try:
+        quoters = await gateway.query_quoters(query)
+    except (ElementNotFoundError, DBConnectionError) as e:
+        log.error(f"Could not query the quoters: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not query the quoters"
+        )
+    except OverloadedError as e:
+        log.error(f"Service overloaded: {e}")
+        return overloaded_response()
+    except Exception as e:
+        log.error(f"Could not query the quoters: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not query the quoters"
+        )
+    return quoters
+
+
+def verify_profiling_token(
+    x_profile_token: Optional[str] = Header(None)
+):
+    if not is_profiling_token(x_profile_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to read the profiles"
+        )
+
+
+@app.get(PROFILES_PATH, dependencies=[Depends(verify_profiling_token)])
+async def list_profiles():
+    return await asyncio.to_thread(profile_store.list)
+
+
+@app.get(
+        f"{PROFILES_PATH}/{{profile_id}}",
+        dependencies=[Depends(verify_profiling_token)]
+)
+async def get_profile(profile_id: str):
+    path = profile_store.path(profile_id)
+    if not path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Could not find the profile"
+        )
+    return FileResponse(
+        path,
+        media_type="application/json",
+        filename=f"{profile_id}.json"
+    )
+
+
 @app.get("/api/v1/quoters/{quoter_id}")
-async def get_quoter(quoter_id: str):
+async def get_quoter(quoter_id: str, include_archived: bool = False):
     try:
-        quoter = await gateway.get_quoter(quoter_id)
+        quoter = await gateway.get_quoter(quoter_id, include_archived)
     except (ElementNotFoundError, DBConnectionError) as e:
         log.error(f"Could not find the quoter: {e}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could not finde the quoter"
         )
+    except OverloadedError as e:
+        log.error(f"Service overloaded: {e}")
+        return overloaded_response()
     except Exception as e:
         log.error(f"Could not find the quoter: {e}")
         raise HTTPException(
@@ -101,15 +346,35 @@ async def get_quoter(quoter_id: str):
         "/api/v1/quoters",
         response_description="Add new quoter",
         response_model=QuoterModel)
-async def insert_quoter(quoter: QuoterModel):
+async def insert_quoter(
+    request: Request,
+    quoter: QuoterModel,
+    idempotency_key: Optional[str] = Header(None)
+):
     try:
-        quoter = await gateway.insert_quoter(quoter)
+        if idempotency_key:
+            quoter = await idempotency_store.run(
+                f"quoters:{idempotency_key}",
+                await get_body_hash(request),
+                lambda: gateway.insert_quoter(quoter)
+            )
+        else:
+            quoter = await gateway.insert_quoter(quoter)
     except (ElementNotFoundError, DBConnectionError) as e:
         log.error(f"Could not create the quoter: {e}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could create the quoter"
         )
+    except IdempotencyKeyError as e:
+        log.error(f"Idempotency key reused: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency key already used with another request"
+        )
+    except OverloadedError as e:
+        log.error(f"Service overloaded: {e}")
+        return overloaded_response()
     except Exception as e:
         log.error(f"Could not create the quoter: {e}")
         raise HTTPException(
@@ -126,15 +391,35 @@ async def insert_quoter(quoter: QuoterModel):
         "/api/v1/sales",
         response_description="Add new sale"
 )
-async def create_sell(quoter: QuoterIdModel):
+async def create_sell(
+    request: Request,
+    quoter: QuoterIdModel,
+    idempotency_key: Optional[str] = Header(None)
+):
     try:
-        sell = await gateway.create_sell(quoter)
+        if idempotency_key:
+            sell = await idempotency_store.run(
+                f"sales:{idempotency_key}",
+                await get_body_hash(request),
+                lambda: gateway.create_sell(quoter)
+            )
+        else:
+            sell = await gateway.create_sell(quoter)
     except (ElementNotFoundError, DBConnectionError) as e:
         log.error(f"Could not create the product: {e}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could create the product"
         )
+    except IdempotencyKeyError as e:
+        log.error(f"Idempotency key reused: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency key already used with another request"
+        )
+    except OverloadedError as e:
+        log.error(f"Service overloaded: {e}")
+        return overloaded_response()
     except Exception as e:
         log.error(f"Could not create the product: {e}")
         raise HTTPException(
@@ -162,6 +447,9 @@ async def update_quoter(quoter_id: str, quoter: QuoterUpdateModel):
             status_code=status.HTTP_409_CONFLICT,
             detail="Could update the quoter due to a sale related "
         )
+    except OverloadedError as e:
+        log.error(f"Service overloaded: {e}")
+        return overloaded_response()
     except Exception as e:
         log.error(f"Could not update the quoter: {e}")
         raise HTTPException(
@@ -174,4 +462,4 @@ async def update_quoter(quoter_id: str, quoter: QuoterUpdateModel):
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", port=5000, log_level="info")
+    uvicorn.run("app.business.main:app", port=5000, log_level="info")
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseSettings
 
 
@@ -16,3 +18,52 @@ class Config(BaseSettings):
     sasl_pass: str
     max_search_elements: int
     kafka_topic: str
+    idempotency_collec: Optional[str] = None
+    idempotency_ttl_seconds: int = 86400
+    idempotency_max_keys: int = 10000
+    idempotency_claim_seconds: float = 30
+    idempotency_poll_interval: float = 0.1
+    server_host: str = "0.0.0.0"
+    server_port: int = 5000
+    server_workers: int = 0
+    server_backlog: int = 2048
+    server_keep_alive: int = 5
+    server_limit_concurrency: Optional[int] = None
+    server_loop: str = "auto"
+    server_http: str = "auto"
+    kafka_flush_timeout: float = 10.0
+    kafka_delivery_timeout: float = 5.0
+    mongo_max_pool_size: int = 100
+    mongo_wait_queue_timeout_ms: Optional[int] = None
+    max_pool_wait_seconds: float = 0.5
+    kafka_max_queue_depth: int = 50000
+    admission_concurrency: int = 100
+    admission_read_concurrency: Optional[int] = None
+    admission_search_concurrency: Optional[int] = None
+    admission_max_queue: int = 200
+    admission_max_wait: float = 1.0
+    admission_retry_after: int = 1
+    search_read_preference: str = "primary"
+    search_max_staleness_seconds: int = 90
+    # Hedged reads are only sent by mongos, so they need mongo_sharded
+    search_hedged_reads: bool = False
+    mongo_sharded: bool = False
+    search_max_time_ms: Optional[int] = None
+    read_max_time_ms: Optional[int] = None
+    archive_quoters_collec: Optional[str] = None
+    archive_after_days: int = 180
+    archive_sold_after_days: int = 30
+    archive_batch_size: int = 500
+    archive_interval_seconds: int = 3600
+    profiling_token: Optional[str] = None
+    profiling_sample_rate: float = 0.0
+    profiling_interval: float = 0.005
+    profiling_dir: str = "/tmp/quoter-profiles"
+    profiling_max_profiles: int = 100
+    kafka_consumer_group: str = "cotizapp-quoter-sales"
+    consumer_batch_size: int = 1000
+    consumer_poll_timeout: float = 1.0
+    consumer_processes: int = 1
+    consumer_retry_seconds: float = 5.0
+    pending_writes_ttl_seconds: int = 60
+    pending_writes_max_entries: int = 10000
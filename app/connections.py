@@ -1,22 +1,44 @@
 from app.config import Config
 from app.errors import DBConnectionError
+from app.infrastructure.pool_monitor import PoolWaitMonitor
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from confluent_kafka import Producer
+from confluent_kafka import Consumer, Producer
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred
+)
 from pymongo.errors import (
     ConfigurationError,
     ConnectionFailure,
 )
 
 conf = Config()
+# Smallest bound Mongo accepts for maxStalenessSeconds
+MIN_MAX_STALENESS_SECONDS = 90
+READ_PREFERENCES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+pool_monitor = PoolWaitMonitor()
 
 
 def create_connection() -> AsyncIOMotorDatabase:
     url_connection = conf.mongodb_url
     database_name = conf.mongo_db
     try:
-        client = AsyncIOMotorClient(url_connection)
+        client = AsyncIOMotorClient(
+            url_connection,
+            maxPoolSize=conf.mongo_max_pool_size,
+            waitQueueTimeoutMS=conf.mongo_wait_queue_timeout_ms,
+            event_listeners=[pool_monitor]
+        )
     except (ConfigurationError, ConnectionFailure) as e:
         raise DBConnectionError(
             f"Could not connect to database due to: {e}"
@@ -24,13 +46,59 @@ def create_connection() -> AsyncIOMotorDatabase:
     return client[database_name]
 
 
-def create_producer() -> Producer:
-
-    kafka_conf = {
+def kafka_settings() -> dict:
+    return {
         "bootstrap.servers": conf.kafka_server,
         "security.protocol": conf.kafka_protocol,
         "sasl.mechanisms": conf.sasl_mechanism,
         "sasl.username": conf.sasl_username,
         "sasl.password": conf.sasl_pass,
     }
+
+
+def create_producer() -> Producer:
+
+    kafka_conf = kafka_settings()
     return Producer(kafka_conf)
+
+
+def create_consumer() -> Consumer:
+
+    kafka_conf = {
+        **kafka_settings(),
+        "group.id": conf.kafka_consumer_group,
+        "enable.auto.commit": False,
+        "auto.offset.reset": "earliest",
+    }
+    return Consumer(kafka_conf)
+
+
+def create_read_preference(
+    mode: str,
+    max_staleness: int,
+    hedged: bool,
+    sharded: bool
+):
+    # Only mongos hedges reads, a replica set silently ignores the option
+    if hedged and not sharded:
+        raise DBConnectionError(
+            "Hedged reads need a sharded cluster reached through mongos"
+        )
+    if mode == "primary":
+        if hedged:
+            raise DBConnectionError("Primary reads cannot be hedged")
+        return Primary()
+    try:
+        read_preference = READ_PREFERENCES[mode]
+    except KeyError:
+        raise DBConnectionError(f"Unknown read preference: {mode}")
+    # Without a bound a lagging secondary serves arbitrarily old data
+    if max_staleness < MIN_MAX_STALENESS_SECONDS:
+        raise DBConnectionError(
+            f"Reads from {mode} need a max staleness of at least "
+            f"{MIN_MAX_STALENESS_SECONDS} seconds"
+        )
+    return read_preference(
+        max_staleness=max_staleness,
+        hedge={"enabled": True} if hedged else None
+    )
@@ -1,9 +1,24 @@
 from enum import Enum
-from datetime import datetime
-from typing import List, TypedDict, Union, Optional
+from datetime import date, datetime
+from functools import lru_cache
+from typing import (
+    Any,
+    Callable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypedDict,
+    TypeVar,
+    Union
+)
 
 from pydantic import BaseModel, Field
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
 from bson import ObjectId
+from bson.errors import InvalidId
+
+Model = TypeVar("Model", bound=BaseModel)
 
 
 class PyObjectId(ObjectId):
@@ -113,6 +128,7 @@ class QuoterModel(BaseModel):
     client: Client
     services: Optional[List[ServiceModel]] = []
     products: Optional[List[ProductModel]] = []
+    updated_at: Optional[datetime] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -153,6 +169,38 @@ class QuoterDictModel(TypedDict):
     client: Client
     services: List[ServiceDictModel]
     products: List[ProducDictModel]
+    updated_at: Optional[datetime]
+
+
+class QuoterSortField(Enum):
+    date = "date"
+    total = "total"
+
+
+class SortOrder(Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class QuoterQueryModel(BaseModel):
+    date_from: Optional[Union[datetime, date]]
+    date_to: Optional[Union[datetime, date]]
+    client_email: Optional[str]
+    client_name: Optional[str]
+    total_min: Optional[float]
+    total_max: Optional[float]
+    sold: Optional[bool]
+    sort_by: QuoterSortField = QuoterSortField.date
+    order: SortOrder = SortOrder.desc
+    page: int = Field(1, ge=1)
+    page_size: int = Field(20, ge=1)
+
+
+class QuoterPageModel(TypedDict):
+    quoters: List[QuoterDictModel]
+    page: int
+    page_size: int
+    has_next: bool
 
 
 class SellModel(BaseModel):
@@ -223,3 +271,125 @@ class MessageFormat(BaseModel):
 
     class Config:
         arbitrary_types_allowed = True
+
+
+def _to_object_id(value: Any) -> Any:
+    return value if isinstance(value, ObjectId) else ObjectId(value)
+
+
+def _to_datetime(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        raise TypeError(f"Not a datetime: {value!r}")
+    # Python 3.9 fromisoformat does not understand the Z suffix
+    if value.endswith("Z"):
+        value = f"{value[:-1]}+00:00"
+    return datetime.fromisoformat(value)
+
+
+def _to_float(value: Any) -> float:
+    if type(value) is float:
+        return value
+    if type(value) is int:
+        return float(value)
+    raise TypeError(f"Not a float: {value!r}")
+
+
+def _to_int(value: Any) -> int:
+    if type(value) is int:
+        return value
+    raise TypeError(f"Not an int: {value!r}")
+
+
+def _to_str(value: Any) -> str:
+    if type(value) is str:
+        return value
+    raise TypeError(f"Not a str: {value!r}")
+
+
+SCALAR_CONVERTERS = {
+    datetime: _to_datetime,
+    float: _to_float,
+    int: _to_int,
+    str: _to_str,
+}
+
+
+def _field_converter(field: ModelField) -> Optional[Callable[[Any], Any]]:
+    field_type = field.type_
+    if isinstance(field_type, type) and issubclass(field_type, BaseModel):
+        if field.shape == SHAPE_LIST:
+            return lambda values: [
+                _hydrate(field_type, value) for value in values
+            ]
+        return lambda value: _hydrate(field_type, value)
+    if field_type is PyObjectId:
+        return _to_object_id
+    if field.shape == SHAPE_SINGLETON:
+        return SCALAR_CONVERTERS.get(field_type)
+    return None
+
+
+@lru_cache(maxsize=None)
+def _document_plan(
+    model: Type[BaseModel]
+) -> Tuple[Tuple[str, str, ModelField, Optional[Callable[[Any], Any]]], ...]:
+    return tuple(
+        (name, field.alias, field, _field_converter(field))
+        for name, field in model.__fields__.items()
+    )
+
+
+def _hydrate(model: Type[Model], document: dict) -> Model:
+    values = {}
+    fields_set = set()
+    for name, alias, field, converter in _document_plan(model):
+        if alias in document:
+            value = document[alias]
+        elif name in document:
+            value = document[name]
+        elif field.required:
+            raise KeyError(name)
+        else:
+            values[name] = field.get_default()
+            continue
+        if value is None:
+            if field.required:
+                raise ValueError(f"Missing value for {name}")
+        elif converter is not None:
+            value = converter(value)
+        values[name] = value
+        fields_set.add(name)
+    # Same as BaseModel.construct without its second pass over the fields
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__fields_set__", fields_set)
+    return instance
+
+
+def from_document(model: Type[Model], document: dict) -> Model:
+    """Build a model from a document stored by this service
+
+    Skips pydantic validation when the document has the shape this service
+    writes, only converting stored ids, ISO dates and numbers back to their
+    types. Documents in any other shape (e.g. written by another consumer)
+    are fully validated instead. Never use it with request bodies.
+
+    Args:
+        model (Type[Model]): model to build
+        document (dict): document read from our own collections
+
+    Returns:
+        Model: model with the document values
+    """
+    try:
+        return _hydrate(model, document)
+    except (KeyError, TypeError, ValueError, InvalidId):
+        return model.parse_obj(
+            {
+                field.alias: document.get(field.alias, document.get(name))
+                for name, field in model.__fields__.items()
+                if field.alias in document or name in document
+            }
+        )
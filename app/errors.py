@@ -12,3 +12,11 @@ class InsertionError(Exception):
 
 class SaleRelatedError(Exception):
     """When there was a problem while inserting a DB"""
+
+
+class OverloadedError(Exception):
+    """When the service is saturated and could not accept more work"""
+
+
+class IdempotencyKeyError(Exception):
+    """When an idempotency key is reused with a different request"""
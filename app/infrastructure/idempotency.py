@@ -0,0 +1,245 @@
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.errors import IdempotencyKeyError
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import (
+    ConnectionFailure,
+    DuplicateKeyError,
+    ExecutionTimeout
+)
+
+
+log = logging.getLogger(__name__)
+IN_FLIGHT = "in_flight"
+DONE = "done"
+# Result given to local waiters when the owner was cancelled
+RETRY = object()
+
+
+@dataclass
+class IdempotencyStore:
+    """Keep the responses of already processed requests by idempotency key
+
+    Responses live in an in-process LRU bounded by ``max_keys`` and
+    ``ttl_seconds``; when ``collection`` is given they are also stored in a
+    Mongo collection with a TTL index so every worker can replay them.
+    Keys are claimed in that collection before running the request, so
+    duplicates in other workers wait for the first one instead of running.
+    """
+
+    ttl_seconds: int
+    max_keys: int
+    collection: Optional[AsyncIOMotorCollection] = None
+    claim_seconds: float = 30
+    poll_interval: float = 0.1
+    _responses: "OrderedDict[str, Tuple[float, str, Any]]" = field(
+        default_factory=OrderedDict
+    )
+    _in_flight: Dict[str, "asyncio.Future[Any]"] = field(
+        default_factory=dict
+    )
+
+    async def create_indexes(self):
+        if self.collection is None:
+            return
+        await self.collection.create_index(
+            "created_at",
+            expireAfterSeconds=self.ttl_seconds
+        )
+
+    async def run(
+        self,
+        key: str,
+        body_hash: str,
+        operation: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Run operation once per key and replay its response afterwards
+
+        Args:
+            key (str): idempotency key, already scoped by route
+            body_hash (str): hash of the request body sent with the key
+            operation (Callable[[], Awaitable[Any]]): work to do on a miss
+
+        Raises:
+            IdempotencyKeyError: key already used with another body
+
+        Returns:
+            Any: response of the first execution for this key
+        """
+        while True:
+            stored = self._get_local(key)
+            if stored is not None:
+                return self._replay(stored, body_hash)
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                outcome = await asyncio.shield(pending)
+                if outcome is RETRY:
+                    continue
+                return self._replay(outcome, body_hash)
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+            try:
+                outcome = await self._run_owned(key, body_hash, operation)
+            except asyncio.CancelledError:
+                # Waiters take over instead of being cancelled with us
+                future.set_result(RETRY)
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # Mark as retrieved, waiters (if any) get the same error
+                future.exception()
+                raise
+            else:
+                future.set_result(outcome)
+            finally:
+                self._in_flight.pop(key, None)
+            return self._replay(outcome, body_hash)
+
+    def _replay(self, outcome: Tuple[str, Any], body_hash: str) -> Any:
+        stored_hash, response = outcome
+        if stored_hash != body_hash:
+            raise IdempotencyKeyError(
+                "Idempotency key already used with another request"
+            )
+        return response
+
+    async def _run_owned(
+        self,
+        key: str,
+        body_hash: str,
+        operation: Callable[[], Awaitable[Any]]
+    ) -> Tuple[str, Any]:
+        claim = uuid.uuid4().hex
+        while True:
+            existing = await self._claim(key, body_hash, claim)
+            if existing is None:
+                break
+            if existing["body_hash"] != body_hash:
+                raise IdempotencyKeyError(
+                    "Idempotency key already used with another request"
+                )
+            if existing["state"] == DONE:
+                outcome = (existing["body_hash"], existing["response"])
+                self._set_local(key, outcome)
+                return outcome
+            await asyncio.sleep(self.poll_interval)
+        try:
+            response = await operation()
+        except BaseException:
+            await self._release(key, claim)
+            raise
+        outcome = (body_hash, response)
+        self._set_local(key, outcome)
+        await self._complete(key, claim, response)
+        return outcome
+
+    def _get_local(self, key: str) -> Optional[Tuple[str, Any]]:
+        element = self._responses.get(key)
+        if element is None:
+            return None
+        expires_at, body_hash, response = element
+        if expires_at < time.monotonic():
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return body_hash, response
+
+    def _set_local(self, key: str, outcome: Tuple[str, Any]):
+        self._responses[key] = (
+            time.monotonic() + self.ttl_seconds,
+            *outcome
+        )
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_keys:
+            self._responses.popitem(last=False)
+
+    async def _claim(
+        self,
+        key: str,
+        body_hash: str,
+        claim: str
+    ) -> Optional[Dict[str, Any]]:
+        """Claim the key for this request
+
+        Returns:
+            Optional[Dict[str, Any]]: None when claimed, otherwise the
+                document of the request holding the key
+        """
+        if self.collection is None:
+            return None
+        now = datetime.utcnow()
+        try:
+            await self.collection.insert_one(
+                {
+                    "_id": key,
+                    "state": IN_FLIGHT,
+                    "claim": claim,
+                    "body_hash": body_hash,
+                    "created_at": now
+                }
+            )
+            return None
+        except DuplicateKeyError:
+            pass
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            log.warning(f"Could not claim idempotency key: {e}")
+            return None
+        try:
+            existing = await self.collection.find_one({"_id": key})
+            if existing is None:
+                # Released or expired meanwhile, try to claim it again
+                return {"state": IN_FLIGHT, "body_hash": body_hash}
+            stale_at = now - timedelta(seconds=self.claim_seconds)
+            if existing["state"] == IN_FLIGHT and (
+                existing["created_at"] < stale_at
+            ):
+                # The owner died without releasing the key, take it over
+                result = await self.collection.update_one(
+                    {"_id": key, "claim": existing["claim"]},
+                    {
+                        "$set": {
+                            "claim": claim,
+                            "body_hash": body_hash,
+                            "created_at": now
+                        }
+                    }
+                )
+                if result.modified_count:
+                    return None
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            log.warning(f"Could not read idempotency key: {e}")
+            return None
+        return existing
+
+    async def _complete(self, key: str, claim: str, response: Any):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": key, "claim": claim},
+                {
+                    "$set": {
+                        "state": DONE,
+                        "response": response,
+                        "created_at": datetime.utcnow()
+                    }
+                }
+            )
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            log.warning(f"Could not store idempotency key: {e}")
+
+    async def _release(self, key: str, claim: str):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.delete_one({"_id": key, "claim": claim})
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            log.warning(f"Could not release idempotency key: {e}")
@@ -0,0 +1,100 @@
+import time
+from datetime import datetime, timezone
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _version(quoter: Dict[str, Any]) -> datetime:
+    updated_at = quoter.get("updated_at")
+    if isinstance(updated_at, str):
+        try:
+            updated_at = datetime.fromisoformat(
+                updated_at.replace("Z", "+00:00")
+            )
+        except ValueError:
+            updated_at = None
+    if updated_at is None:
+        # Quoters written before versioning are older than any pending one
+        return datetime.min
+    if updated_at.tzinfo is not None:
+        updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return updated_at
+
+
+@dataclass
+class PendingWrites:
+    """Quoters and sales published to the stream but maybe not persisted
+
+    Entries live until the persisted version, or a newer one, is observed
+    or ``ttl_seconds`` pass, and at most ``max_entries`` of each kind are
+    kept. Quoters are versioned by their ``updated_at`` write timestamp.
+
+    The entries live in the memory of one process: with several server
+    workers, read-your-writes only holds when the read is served by the
+    worker that published the write.
+    """
+
+    ttl_seconds: int
+    max_entries: int
+    _quoters: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = field(
+        default_factory=OrderedDict
+    )
+    _sales: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = field(
+        default_factory=OrderedDict
+    )
+
+    def _add(self, entries: OrderedDict, key: str, document: Dict[str, Any]):
+        entries[key] = (time.monotonic() + self.ttl_seconds, document)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _expire(self, entries: OrderedDict):
+        now = time.monotonic()
+        # Entries are kept in insertion order, so the oldest expire first
+        while entries:
+            key, (expires_at, _) = next(iter(entries.items()))
+            if expires_at >= now:
+                break
+            del entries[key]
+
+    def add_quoter(self, quoter: Dict[str, Any]):
+        self._add(self._quoters, quoter["_id"], quoter)
+
+    def add_sale(self, sale: Dict[str, Any]):
+        self._add(self._sales, sale["quoter_id"], sale)
+
+    def quoter(self, quoter_id: str) -> Optional[Dict[str, Any]]:
+        self._expire(self._quoters)
+        element = self._quoters.get(quoter_id)
+        return element[1] if element else None
+
+    def quoters(self) -> List[Dict[str, Any]]:
+        self._expire(self._quoters)
+        return [quoter for _, quoter in self._quoters.values()]
+
+    def sale_by_quoter(self, quoter_id: str) -> Optional[Dict[str, Any]]:
+        self._expire(self._sales)
+        element = self._sales.get(quoter_id)
+        return element[1] if element else None
+
+    def observe_quoter(self, quoter: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the freshest version of a quoter read from DB
+
+        Args:
+            quoter (Dict[str, Any]): quoter as stored in DB
+
+        Returns:
+            Dict[str, Any]: pending version when DB is not up to date yet
+        """
+        pending = self.quoter(quoter["_id"])
+        if pending is None:
+            return quoter
+        if _version(quoter) >= _version(pending):
+            del self._quoters[quoter["_id"]]
+            return quoter
+        return pending
+
+    def observe_sale(self, quoter_id: str):
+        self._sales.pop(quoter_id, None)
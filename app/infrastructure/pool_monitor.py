@@ -0,0 +1,66 @@
+import time
+import threading
+
+from pymongo.monitoring import ConnectionPoolListener
+
+
+class PoolWaitMonitor(ConnectionPoolListener):
+    """Track how long operations wait for a Motor pool connection
+
+    Keeps an exponential moving average of the checkout wait in seconds,
+    updated from the pymongo connection pool events.
+    """
+
+    def __init__(self, smoothing: float = 0.2, max_age: float = 5.0):
+        self.smoothing = smoothing
+        self.max_age = max_age
+        self.average_wait = 0.0
+        self.last_sample_at = 0.0
+        self._started = threading.local()
+
+    def _record(self, wait: float):
+        self.average_wait += self.smoothing * (wait - self.average_wait)
+        self.last_sample_at = time.monotonic()
+
+    def recent_wait(self) -> float:
+        """Average checkout wait, zero when there are no recent samples
+
+        Without this, a high average would reject every request forever
+        because rejected requests never check out a connection again.
+        """
+        if time.monotonic() - self.last_sample_at > self.max_age:
+            return 0.0
+        return self.average_wait
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.monotonic()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._started, "at", None)
+        if started is not None:
+            self._record(time.monotonic() - started)
+            self._started.at = None
+
+    def connection_check_out_failed(self, event):
+        self.connection_checked_out(event)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
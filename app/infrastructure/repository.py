@@ -1,43 +1,123 @@
+import re
 import asyncio
 import logging
-from typing import List, Union
-from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple, Union
+from dataclasses import dataclass, field
 
 from app.config import Config
+from app.profiling import profile_spans
+from app.connections import create_read_preference
 from app.errors import (
     ElementNotFoundError,
     InsertionError,
-    DBConnectionError
+    DBConnectionError,
+    OverloadedError
 )
 from app.entities.models import (
     MessageFormat,
     MessageType,
     QuoterDictModel,
     QuoterModel,
-    SellModel
+    QuoterQueryModel,
+    SellDictModel,
+    SellModel,
+    SortOrder
 )
 from app.infrastructure.repository_i import RepositoryInterface
 
 from pydantic import BaseSettings
 from confluent_kafka import Producer
 from fastapi.encoders import jsonable_encoder
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from motor.motor_asyncio import (
+    AsyncIOMotorCollection,
+    AsyncIOMotorDatabase
+)
+from pymongo import ASCENDING, DESCENDING, DeleteOne, ReplaceOne
+from pymongo.read_preferences import Primary
 from pymongo.errors import (
+    BulkWriteError,
     ConnectionFailure,
-    ExecutionTimeout
+    ExecutionTimeout,
+    WaitQueueTimeoutError
 )
 
 
 log = logging.getLogger(__name__)
 EMPTY_COUNT = 0
+ARCHIVE_RETRIES = 3
+
+
+def log_delivery(error, message):
+    if error is not None:
+        log.error(f"Could not deliver message to {message.topic()}: {error}")
+
 
+def set_delivery(delivered: asyncio.Future, error):
+    # The wait may have timed out already
+    if not delivered.done():
+        delivered.set_result(error)
+
+
+# Every sort ends with _id so pages are stable between equal values
+QUOTER_INDEXES = (
+    [("date", DESCENDING), ("_id", DESCENDING)],
+    [("total", DESCENDING), ("_id", DESCENDING)],
+    [("client.email", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+    [("client.email", ASCENDING), ("total", DESCENDING), ("_id", DESCENDING)],
+    [("client.name", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+)
+QUOTER_SUMMARY_PROJECTION = {
+    "name": 1,
+    "date": 1,
+    "subtotal": 1,
+    "iva": 1,
+    "total": 1,
+    "description": 1,
+    "client": 1,
+}
 
+
+@profile_spans
 @dataclass
 class Repository(RepositoryInterface):
 
     nosql_conn: AsyncIOMotorDatabase
     messaging_con: Producer
     conf: BaseSettings = Config()
+    search_quoters: AsyncIOMotorCollection = field(init=False)
+    primary_conn: AsyncIOMotorDatabase = field(init=False)
+
+    def __post_init__(self):
+        # Heavy list and search queries may go to secondaries, lookups
+        # that must see the latest writes are pinned to the primary,
+        # whatever read preference mongodb_url sets
+        self.primary_conn = self.nosql_conn.with_options(
+            read_preference=Primary()
+        )
+        self.search_quoters = self.nosql_conn[
+            self.conf.quoters_collec
+        ].with_options(
+            read_preference=create_read_preference(
+                self.conf.search_read_preference,
+                self.conf.search_max_staleness_seconds,
+                self.conf.search_hedged_reads,
+                self.conf.mongo_sharded
+            )
+        )
+
+    async def create_indexes(self):
+        quoters = self.nosql_conn[self.conf.quoters_collec]
+        try:
+            for keys in QUOTER_INDEXES:
+                await quoters.create_index(keys)
+            sales = self.nosql_conn[self.conf.sales_collec]
+            await sales.create_index("quoter_id")
+            await sales.create_index([("date", ASCENDING), ("_id", ASCENDING)])
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            raise DBConnectionError(f"Could not create indexes: {e}")
 
     async def search_quoter_by_content(
         self,
@@ -50,39 +130,49 @@ class Repository(RepositoryInterface):
                 services_match,
                 products_match
             ) = await asyncio.gather(
-                self.nosql_conn[self.conf.quoters_collec].find(
+                self.search_quoters.find(
                     {
                         "name": {
                             "$regex": content,
                             "$options": "mxsi"
                         }
                     }
+                ).max_time_ms(
+                    self.conf.search_max_time_ms
                 ).to_list(self.conf.max_search_elements),
-                self.nosql_conn[self.conf.quoters_collec].find(
+                self.search_quoters.find(
                     {
                         "description": {
                             "$regex": content,
                             "$options": "mxsi"
                         }
                     }
+                ).max_time_ms(
+                    self.conf.search_max_time_ms
                 ).to_list(self.conf.max_search_elements),
-                self.nosql_conn[self.conf.quoters_collec].find(
+                self.search_quoters.find(
                     {
                         "services.name": {
                             "$regex": content,
                             "$options": "mxsi"
                         }
                     }
+                ).max_time_ms(
+                    self.conf.search_max_time_ms
                 ).to_list(self.conf.max_search_elements),
-                self.nosql_conn[self.conf.quoters_collec].find(
+                self.search_quoters.find(
                     {
                         "products.title": {
                                 "$regex": content,
                                 "$options": "mxsi"
                         }
                     }
+                ).max_time_ms(
+                    self.conf.search_max_time_ms
                 ).to_list(self.conf.max_search_elements)
             )
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
         except (ConnectionFailure, ExecutionTimeout):
             raise DBConnectionError(
                 "Could not found service in DB"
@@ -95,10 +185,14 @@ class Repository(RepositoryInterface):
 
     async def get_quoters(self) -> List[QuoterDictModel]:
         try:
-            quoters = await self.nosql_conn[self.conf.quoters_collec].find(
+            quoters = await self.search_quoters.find(
+            ).max_time_ms(
+                self.conf.search_max_time_ms
             ).to_list(
                 self.conf.max_search_elements
             )
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
         except (ConnectionFailure, ExecutionTimeout):
             raise DBConnectionError(
                 "Quoter not found in DB"
@@ -109,11 +203,117 @@ class Repository(RepositoryInterface):
             )
         return quoters
 
-    async def get_quoter(self, quoter_id: str) -> QuoterDictModel:
+    def quoter_query_pipeline(
+        self,
+        query: QuoterQueryModel,
+        page_size: int
+    ) -> List[dict]:
+        # Dates are stored as ISO strings by jsonable_encoder, a date
+        # without time covers the whole day
+        match: dict = {}
+        date_range = {}
+        if query.date_from:
+            date_range["$gte"] = query.date_from.isoformat()
+        if isinstance(query.date_to, datetime):
+            date_range["$lte"] = query.date_to.isoformat()
+        elif query.date_to:
+            date_range["$lt"] = (query.date_to + timedelta(days=1)).isoformat()
+        if date_range:
+            match["date"] = date_range
+        total_range = {}
+        if query.total_min is not None:
+            total_range["$gte"] = query.total_min
+        if query.total_max is not None:
+            total_range["$lte"] = query.total_max
+        if total_range:
+            match["total"] = total_range
+        if query.client_email:
+            match["client.email"] = query.client_email
+        if query.client_name:
+            # Anchored prefix so the client.name index can be used
+            match["client.name"] = {
+                "$regex": f"^{re.escape(query.client_name)}"
+            }
+        direction = ASCENDING if query.order is SortOrder.asc else DESCENDING
+        # One extra element tells whether there is a next page
+        pagination = [
+            {"$skip": (query.page - 1) * page_size},
+            {"$limit": page_size + 1},
+        ]
+        pipeline = [
+            {"$match": match},
+            {"$sort": {query.sort_by.value: direction, "_id": direction}},
+        ]
+        if query.sold is None:
+            pipeline.extend(pagination)
+        else:
+            pipeline.extend(
+                [
+                    {
+                        "$lookup": {
+                            "from": self.conf.sales_collec,
+                            "localField": "_id",
+                            "foreignField": "quoter_id",
+                            "as": "sales"
+                        }
+                    },
+                    {
+                        "$match": {
+                            "sales": {"$ne": []} if query.sold else []
+                        }
+                    },
+                    *pagination,
+                ]
+            )
+        pipeline.append({"$project": QUOTER_SUMMARY_PROJECTION})
+        return pipeline
+
+    async def query_quoters(
+        self,
+        query: QuoterQueryModel
+    ) -> List[QuoterDictModel]:
+        page_size = min(query.page_size, self.conf.max_search_elements)
+        pipeline = self.quoter_query_pipeline(query, page_size)
+        options = {}
+        if self.conf.search_max_time_ms:
+            options["maxTimeMS"] = self.conf.search_max_time_ms
         try:
-            quoter = await self.nosql_conn[self.conf.quoters_collec].find_one(
-                {"_id": quoter_id}
+            return await self.search_quoters.aggregate(
+                pipeline,
+                **options
+            ).to_list(page_size + 1)
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
+        except (ConnectionFailure, ExecutionTimeout):
+            raise DBConnectionError(
+                "Could not query quoters in DB"
             )
+
+    async def get_quoter(
+        self,
+        quoter_id: str,
+        include_archived: bool = False
+    ) -> QuoterDictModel:
+        try:
+            quoter = await self.primary_conn[
+                self.conf.quoters_collec
+            ].find_one(
+                {"_id": quoter_id},
+                max_time_ms=self.conf.read_max_time_ms
+            )
+            if (
+                not quoter
+                and include_archived
+                and self.conf.archive_quoters_collec
+            ):
+                quoter = await self.primary_conn[
+                    self.conf.archive_quoters_collec
+                ].find_one(
+                    {"_id": quoter_id},
+                    max_time_ms=self.conf.read_max_time_ms
+                )
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
         except (ConnectionFailure, ExecutionTimeout):
             raise DBConnectionError(
                 "Quoter not found in DB"
@@ -128,20 +328,27 @@ class Repository(RepositoryInterface):
         quoter = jsonable_encoder(quoter)
         try:
             await self.nosql_conn[self.conf.quoters_collec].insert_one(quoter)
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
         except (ConnectionFailure, ExecutionTimeout):
             raise InsertionError("Could not insert quoter in DB")
         return quoter
 
     async def update_quoter(self, quoter_id: str, quoter: QuoterModel):
         query = {"_id": quoter_id}
+        # Stored in the same form as insert_quoter, dates as ISO strings
+        document = jsonable_encoder(quoter, exclude_unset=True)
+        document["updated_at"] = jsonable_encoder(datetime.utcnow())
         values = {
-            "$set": quoter.dict(exclude_unset=True)
+            "$set": document
         }
         try:
             await self.nosql_conn[self.conf.quoters_collec].update_one(
                 query,
                 values
             )
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
         except (ConnectionFailure, ExecutionTimeout):
             raise InsertionError("Could not update quoter in DB")
 
@@ -149,15 +356,22 @@ class Repository(RepositoryInterface):
         sell = jsonable_encoder(sell)
         try:
             await self.nosql_conn[self.conf.sales_collec].insert_one(sell)
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
         except (ConnectionFailure, ExecutionTimeout):
             raise InsertionError("Could not insert quoter in DB")
         return sell
 
     async def find_sell_by_quoter(self, quoter_id: str):
         try:
-            quoter = await self.nosql_conn[self.conf.sales_collec].find_one(
-                {"quoter_id": quoter_id}
+            quoter = await self.primary_conn[
+                self.conf.sales_collec
+            ].find_one(
+                {"quoter_id": quoter_id},
+                max_time_ms=self.conf.read_max_time_ms
             )
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
         except (ConnectionFailure, ExecutionTimeout):
             raise DBConnectionError(
                 "Quoter not found in DB"
@@ -168,6 +382,156 @@ class Repository(RepositoryInterface):
             )
         return quoter
 
+    async def _move_to_archive(
+        self,
+        quoters: List[QuoterDictModel]
+    ) -> Tuple[int, List[str]]:
+        hot = self.primary_conn[self.conf.quoters_collec]
+        archive = self.primary_conn[self.conf.archive_quoters_collec]
+        # Upsert first so a failure between both steps never loses a
+        # quoter, it is only moved again next time
+        await archive.bulk_write(
+            [
+                ReplaceOne({"_id": quoter["_id"]}, quoter, upsert=True)
+                for quoter in quoters
+            ],
+            ordered=False
+        )
+        # Only delete the version archived, a quoter updated meanwhile
+        # stays in the hot tier and is returned to be moved again
+        result = await hot.bulk_write(
+            [
+                DeleteOne(
+                    {
+                        "_id": quoter["_id"],
+                        "updated_at": quoter.get("updated_at")
+                    }
+                )
+                for quoter in quoters
+            ],
+            ordered=False
+        )
+        if result.deleted_count == len(quoters):
+            return result.deleted_count, []
+        missed = await hot.distinct(
+            "_id",
+            {"_id": {"$in": [quoter["_id"] for quoter in quoters]}}
+        )
+        return result.deleted_count, missed
+
+    async def archive_quoters(
+        self,
+        older_than: str,
+        sold_before: str,
+        sold_after: Optional[str] = None
+    ) -> int:
+        # Dates are stored as ISO strings by jsonable_encoder, so they
+        # compare in chronological order
+        # Read on the primary, the versions read are the ones deleted
+        hot = self.primary_conn[self.conf.quoters_collec]
+        sales = self.primary_conn[self.conf.sales_collec]
+        batch_size = self.conf.archive_batch_size
+        archived = 0
+        try:
+            while True:
+                quoters = await hot.find(
+                    {"date": {"$lt": older_than}}
+                ).limit(batch_size).to_list(batch_size)
+                if quoters.__len__() == EMPTY_COUNT:
+                    break
+                # Quoters updated meanwhile still match and are read
+                # again with their new version
+                moved, _ = await self._move_to_archive(quoters)
+                if moved == EMPTY_COUNT:
+                    # Every quoter of the batch is being updated
+                    break
+                archived += moved
+            # Walk the sales index instead of joining every hot quoter
+            sold_dates = {"$lt": sold_before}
+            if sold_after:
+                sold_dates["$gte"] = sold_after
+            query: dict = {"date": sold_dates}
+            missed: List[str] = []
+            while True:
+                sold = await sales.find(
+                    query,
+                    {"quoter_id": 1, "date": 1}
+                ).sort(
+                    [("date", ASCENDING), ("_id", ASCENDING)]
+                ).limit(batch_size).to_list(batch_size)
+                if sold.__len__() == EMPTY_COUNT:
+                    break
+                last = sold[-1]
+                query = {
+                    "date": sold_dates,
+                    "$or": [
+                        {"date": {"$gt": last["date"]}},
+                        {"date": last["date"], "_id": {"$gt": last["_id"]}}
+                    ]
+                }
+                quoters = await hot.find(
+                    {"_id": {"$in": [sale["quoter_id"] for sale in sold]}}
+                ).to_list(batch_size)
+                if quoters:
+                    moved, batch_missed = await self._move_to_archive(
+                        quoters
+                    )
+                    archived += moved
+                    missed.extend(batch_missed)
+            # The sales walked are not walked again, so the quoters updated
+            # while being moved are moved again with their new version
+            for _ in range(ARCHIVE_RETRIES):
+                if not missed:
+                    break
+                quoters = await hot.find(
+                    {"_id": {"$in": missed}}
+                ).to_list(None)
+                if not quoters:
+                    break
+                moved, missed = await self._move_to_archive(quoters)
+                archived += moved
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
+        except (ConnectionFailure, ExecutionTimeout, BulkWriteError) as e:
+            raise InsertionError(f"Could not archive quoters: {e}")
+        if missed:
+            # Fail the run so the caller walks these sales again next time
+            raise InsertionError(
+                f"Could not archive {len(missed)} sold quoters being updated"
+            )
+        return archived
+
+    async def upsert_events(
+        self,
+        quoters: List[QuoterDictModel],
+        sales: List[SellDictModel]
+    ):
+        writes = []
+        for collection, documents in (
+            (self.conf.quoters_collec, quoters),
+            (self.conf.sales_collec, sales)
+        ):
+            if documents:
+                writes.append(
+                    self.nosql_conn[collection].bulk_write(
+                        [
+                            ReplaceOne(
+                                {"_id": document["_id"]},
+                                document,
+                                upsert=True
+                            )
+                            for document in documents
+                        ],
+                        ordered=False
+                    )
+                )
+        try:
+            await asyncio.gather(*writes)
+        except WaitQueueTimeoutError:
+            raise OverloadedError("Timed out waiting for a DB connection")
+        except (ConnectionFailure, ExecutionTimeout, BulkWriteError) as e:
+            raise InsertionError(f"Could not apply events in DB: {e}")
+
     async def notify(
         self,
         quoter_sell: Union[SellModel, QuoterModel],
@@ -176,8 +540,38 @@ class Repository(RepositoryInterface):
         message = MessageFormat(
             type=_type.value,
             content=quoter_sell)
-        self.messaging_con.produce(
-            self.conf.kafka_topic,
-            message.json(encoder=str).encode("utf-8")
-        )
-        self.messaging_con.flush()
+        # Keyed by quoter so all the events of a quoter and its sale go to
+        # the same partition and are consumed in order
+        if _type is MessageType.sell:
+            key = quoter_sell.quoter_id
+        else:
+            key = str(quoter_sell.id)
+        loop = asyncio.get_running_loop()
+        delivered = loop.create_future()
+
+        def on_delivery(error, message):
+            log_delivery(error, message)
+            # Called from the thread polling the producer
+            loop.call_soon_threadsafe(set_delivery, delivered, error)
+
+        try:
+            self.messaging_con.produce(
+                self.conf.kafka_topic,
+                message.json(encoder=str).encode("utf-8"),
+                key=key,
+                on_delivery=on_delivery
+            )
+        except BufferError:
+            raise OverloadedError("Kafka local queue is full")
+        self.messaging_con.poll(0)
+        # Wait for the broker without blocking the event loop, the write
+        # is only accepted once it is really stored in the topic
+        try:
+            error = await asyncio.wait_for(
+                delivered,
+                self.conf.kafka_delivery_timeout
+            )
+        except asyncio.TimeoutError:
+            raise OverloadedError("Kafka did not confirm the delivery")
+        if error is not None:
+            raise InsertionError(f"Could not publish the event: {error}")
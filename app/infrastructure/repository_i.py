@@ -1,9 +1,13 @@
-from typing import Any, List
+from typing import Any, List, Optional
 from abc import ABC, abstractmethod
 
 
 class RepositoryInterface(ABC):
 
+    @abstractmethod
+    async def create_indexes(self):
+        """Create the indexes used by the quoter and sale queries"""
+
     @abstractmethod
     async def search_quoter_by_content(self, content: str) -> List[Any]:
         """Search a quoter by the content of it
@@ -24,11 +28,28 @@ class RepositoryInterface(ABC):
         """
 
     @abstractmethod
-    async def get_quoter(self, quoter_id: str) -> Any:
+    async def query_quoters(self, query: Any) -> List[Any]:
+        """Get a page of quoters matching the structured filters
+
+        Args:
+            query (Any): filters, sort and page to get
+
+        Returns:
+            List[Any]: quoters found, one more than the page size when
+                there is a next page
+        """
+
+    @abstractmethod
+    async def get_quoter(
+        self,
+        quoter_id: str,
+        include_archived: bool = False
+    ) -> Any:
         """Word to search into product catalog
 
         Args:
             quoter_id (str): quoter id to find
+            include_archived (bool): look into the archive on a miss
 
         Returns:
             Any: Quoter information found
@@ -51,7 +72,7 @@ class RepositoryInterface(ABC):
 
         Args:
             quoter_id (str): quoter id to update
-            quoter (Any): quoter data to update
+            quoter (Any): quoter data to update, a new updated_at is set
 
         Returns:
             Any: Quoter data updated
@@ -76,6 +97,40 @@ class RepositoryInterface(ABC):
         Returns:
             Any: Sale found
         """
+
+    @abstractmethod
+    async def archive_quoters(
+        self,
+        older_than: str,
+        sold_before: str,
+        sold_after: Optional[str] = None
+    ) -> int:
+        """Move old and sold quoters to the archive collection
+
+        Args:
+            older_than (str): archive quoters dated before this date
+            sold_before (str): archive quoters sold before this date
+            sold_after (Optional[str]): skip sales before this date, they
+                were already handled
+
+        Raises:
+            InsertionError: quoters could not be moved, including sold
+                quoters updated while being moved, so the same sales
+                must be walked again
+
+        Returns:
+            int: number of quoters archived
+        """
+
+    @abstractmethod
+    async def upsert_events(self, quoters: List[Any], sales: List[Any]):
+        """Insert or replace quoters and sales by id in bulk
+
+        Args:
+            quoters (List[Any]): quoters to write
+            sales (List[Any]): sales to write
+        """
+
     @abstractmethod
     async def notify(self, quoter_sell: Any, _type: str):
         """Notify quoter or sell into message system
@@ -0,0 +1,155 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+import contextvars
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+PROFILE_ID = re.compile(r"[0-9a-f]{32}")
+current_profile: contextvars.ContextVar = contextvars.ContextVar(
+    "current_profile",
+    default=None
+)
+
+
+class StackSampler:
+    """Sample the stack of a thread at a fixed interval
+
+    Stacks are kept collapsed (``outer;inner count``) so they can be fed
+    directly to flamegraph tools.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(
+                    f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.items()
+        )
+
+
+@dataclass
+class Profile:
+    method: str
+    path: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+    stacks: str = ""
+
+
+def profile_spans(cls):
+    """Record a span for each public coroutine of cls in the active profile
+
+    Calls made outside a profiled request only pay a context var lookup.
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(method):
+            continue
+        setattr(cls, name, _span(f"{cls.__name__}.{name}", method))
+    return cls
+
+
+def _span(span_name: str, method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return await method(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            profile.spans.append(
+                {
+                    "name": span_name,
+                    "start": started,
+                    "duration": time.perf_counter() - started
+                }
+            )
+    return wrapper
+
+
+@dataclass
+class ProfileStore:
+    """Keep the last ``max_profiles`` profiles as JSON files in a directory"""
+
+    directory: str
+    max_profiles: int
+
+    def save(self, profile: Profile):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{profile.id}.json")
+        with open(path, "w") as profile_file:
+            json.dump(profile.__dict__, profile_file)
+        for old_profile in self.list()[self.max_profiles:]:
+            try:
+                os.remove(
+                    os.path.join(self.directory, f"{old_profile['id']}.json")
+                )
+            except FileNotFoundError:
+                pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Stored profiles, newest first"""
+        try:
+            file_names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for file_name in file_names:
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, file_name))
+            except FileNotFoundError:
+                # Pruned by a save running in another thread
+                continue
+            entries.append(
+                {
+                    "id": file_name[:-len(".json")],
+                    "modified_at": stat.st_mtime,
+                    "size": stat.st_size
+                }
+            )
+        return sorted(entries, key=lambda e: e["modified_at"], reverse=True)
+
+    def path(self, profile_id: str) -> Optional[str]:
+        if not PROFILE_ID.fullmatch(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.json")
+        if not os.path.isfile(path):
+            return None
+        return path
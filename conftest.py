@@ -0,0 +1,39 @@
+"""Settings of the test session
+
+The app reads its settings from the environment when its modules are
+imported, so tests needing them import those modules inside fixtures or
+tests, after the ``settings`` fixture has set the missing ones.
+"""
+import os
+
+import pytest
+
+SETTINGS = {
+    "client_id": "test",
+    "client_secret": "test",
+    "mongodb_url": "mongodb://localhost:27017",
+    "mongo_db": "test_quoter_sales",
+    "sales_collec": "sales",
+    "quoters_collec": "quoters",
+    "stream_consume": "false",
+    "kafka_server": "localhost:9092",
+    "kafka_protocol": "PLAINTEXT",
+    "sasl_mechanism": "PLAIN",
+    "sasl_username": "test",
+    "sasl_pass": "test",
+    "max_search_elements": "50",
+    "kafka_topic": "test",
+}
+
+
+@pytest.fixture(scope="session")
+def settings():
+    # Settings are read case-insensitively, keep any given spelling
+    given = {name.lower() for name in os.environ}
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in SETTINGS.items():
+            if name not in given:
+                monkeypatch.setenv(name, value)
+        from app.config import Config
+
+        yield Config()
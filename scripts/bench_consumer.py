@@ -0,0 +1,191 @@
+"""Throughput of the stream consumer against a stand-in broker
+
+The broker is replaced by an in-process consumer that serves pre-built
+events in the format published by Repository.notify. The events are
+split round-robin between the worker processes, as if each worker owned
+its own partitions in a consumer group.
+
+Without --mongodb-url the events are decoded and batched but not written,
+which measures the consumer overhead alone. Run from the repository root
+with the service environment variables set:
+
+    python scripts/bench_consumer.py --events 100000 --processes 1 2 4
+    python scripts/bench_consumer.py --mongodb-url mongodb://localhost:27017
+"""
+import time
+import asyncio
+import argparse
+import multiprocessing
+from datetime import datetime
+from typing import List
+
+from app.entities.models import (
+    Client,
+    MessageFormat,
+    MessageType,
+    QuoterModel,
+    SellModel
+)
+
+
+class StandInMessage:
+
+    def __init__(self, value: bytes, partition: int, offset: int):
+        self._value = value
+        self._partition = partition
+        self._offset = offset
+
+    def error(self):
+        return None
+
+    def value(self) -> bytes:
+        return self._value
+
+    def topic(self) -> str:
+        return "bench"
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+
+class StandInConsumer:
+
+    def __init__(self, messages: List[StandInMessage]):
+        self.messages = messages
+        self.position = 0
+        self.commits = 0
+
+    def consume(self, num_messages: int, timeout: float):
+        batch = self.messages[self.position:self.position + num_messages]
+        self.position += len(batch)
+        return batch
+
+    def commit(self, asynchronous: bool = True):
+        self.commits += 1
+
+    def seek(self, partition):
+        self.position = 0
+
+    def close(self):
+        pass
+
+
+class NullRepository:
+
+    async def upsert_events(self, quoters, sales):
+        pass
+
+
+def build_events(count: int) -> List[bytes]:
+    events = []
+    for number in range(count):
+        quoter = QuoterModel(
+            name=f"quoter {number}",
+            date=datetime.utcnow(),
+            subtotal=100,
+            iva=16,
+            total=116,
+            percentage_in_advance_pay=50,
+            revenue_percentage=20,
+            first_pay=58,
+            second_pay=58,
+            description="bench",
+            client=Client(
+                name="client",
+                location="location",
+                email="client@example.com",
+                phone_number=5555555555
+            ),
+            services=[
+                {
+                    "name": "service",
+                    "description": "service",
+                    "client_price": 10,
+                    "real_price": 5
+                }
+            ] * 10
+        )
+        events.append(
+            MessageFormat(type=MessageType.quoter.value, content=quoter)
+            .json(encoder=str).encode("utf-8")
+        )
+        if number % 10 == 0:
+            sale = SellModel(date=datetime.utcnow(), quoter_id=str(quoter.id))
+            events.append(
+                MessageFormat(type=MessageType.sell.value, content=sale)
+                .json(encoder=str).encode("utf-8")
+            )
+    return events
+
+
+def run_worker(events, batch_size, mongodb_url, queue):
+    from app.business.consumer import apply_messages
+
+    async def run():
+        if mongodb_url:
+            from app.config import Config
+            from app.infrastructure.repository import Repository
+            from motor.motor_asyncio import AsyncIOMotorClient
+            repository = Repository(
+                AsyncIOMotorClient(mongodb_url)[Config().mongo_db],
+                None
+            )
+        else:
+            repository = NullRepository()
+        consumer = StandInConsumer(
+            [
+                StandInMessage(event, 0, offset)
+                for offset, event in enumerate(events)
+            ]
+        )
+        started = time.perf_counter()
+        while True:
+            messages = consumer.consume(batch_size, 0)
+            if not messages:
+                break
+            await apply_messages(consumer, repository, messages)
+        return time.perf_counter() - started
+
+    queue.put(asyncio.run(run()))
+
+
+def bench(events, processes, batch_size, mongodb_url) -> float:
+    queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(events[number::processes], batch_size, mongodb_url, queue)
+        )
+        for number in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    elapsed = max(queue.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return len(events) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--mongodb-url")
+    args = parser.parse_args()
+    events = build_events(args.events)
+    for processes in args.processes:
+        throughput = bench(
+            events,
+            processes,
+            args.batch_size,
+            args.mongodb_url
+        )
+        print(f"{processes} process(es): {throughput:,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
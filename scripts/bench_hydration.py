@@ -0,0 +1,122 @@
+"""Cost of building a stored quoter with and without validation
+
+Builds a quoter with the given number of line items (half services, half
+products), stores it the way the repository does and times
+QuoterModel(**document) against from_document. Memory is the size
+retained by one built quoter and the peak while building it, measured
+with tracemalloc. Before timing, it checks that both paths build the
+same model, also for documents using a Z suffix on dates and ints in
+float fields. Run from the repository root with the service environment
+variables set:
+
+    python scripts/bench_hydration.py --items 500 --rounds 200
+"""
+import time
+import argparse
+import tracemalloc
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from app.entities.models import QuoterModel, from_document
+
+
+def build_document(items: int) -> dict:
+    service = {
+        "name": "Mantenimiento",
+        "description": "Mantenimiento preventivo y correctivo",
+        "client_price": 522.0,
+        "real_price": 200.0
+    }
+    product = {
+        "title": "Minisplit",
+        "list_price": 9500.0,
+        "discount_price": 8900.0,
+        "image": "https://example.com/minisplit.png",
+        "stock_number": 12,
+        "brand": "Mirage",
+        "product_id": 1020,
+        "model": "MX-12",
+        "sat_key": 40101701,
+        "weight": 35.5
+    }
+    quoter = QuoterModel(
+        name="Instalacion",
+        date=datetime.utcnow(),
+        subtotal=1000.0,
+        iva=160.0,
+        total=1160.0,
+        percentage_in_advance_pay=50.0,
+        revenue_percentage=30.0,
+        first_pay=580.0,
+        second_pay=580.0,
+        description="Instalacion de equipos",
+        client={
+            "name": "Cliente",
+            "location": "CDMX",
+            "email": "cliente@example.com",
+            "phone_number": 5512345678
+        },
+        services=[service] * (items // 2),
+        products=[product] * (items - items // 2)
+    )
+    return jsonable_encoder(quoter)
+
+
+def check_same(document: dict):
+    validated = QuoterModel(**document)
+    hydrated = from_document(QuoterModel, document)
+    assert validated == hydrated, "from_document built a different quoter"
+    assert validated.json() == hydrated.json(), "different JSON output"
+    assert (
+        validated.dict(exclude_unset=True)
+        == hydrated.dict(exclude_unset=True)
+    ), "different set fields"
+
+
+def check_documents(document: dict):
+    check_same(document)
+    zulu = dict(document, date=f"{document['date']}Z")
+    check_same(zulu)
+    ints = dict(document, subtotal=1000, iva=160)
+    check_same(ints)
+    assert type(from_document(QuoterModel, ints).subtotal) is float
+    foreign = dict(document, total="1160")
+    check_same(foreign)
+
+
+def measure(name: str, build, rounds: int):
+    build()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        build()
+    elapsed = (time.perf_counter() - start) / rounds
+    tracemalloc.start()
+    quoter = build()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del quoter
+    print(
+        f"{name:>15}: {elapsed * 1000:8.2f} ms/quoter "
+        f"{retained / 1024:8.0f} KiB retained {peak / 1024:8.0f} KiB peak"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    document = build_document(args.items)
+    check_documents(document)
+    print(f"{args.items} line items, {args.rounds} rounds")
+    measure("validated", lambda: QuoterModel(**document), args.rounds)
+    measure(
+        "from_document",
+        lambda: from_document(QuoterModel, document),
+        args.rounds
+    )
+
+
+if __name__ == "__main__":
+    main()
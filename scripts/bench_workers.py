@@ -0,0 +1,258 @@
+"""Throughput of python -m app with 1, 2, 4 and 8 workers
+
+Starts the API with ``python -m app`` once per worker count and loads
+GET /api/v1/quoters/{id} with keep-alive connections from several client
+processes, printing the requests per second served by each run.
+
+Without --mongodb-url the gateway of every worker is replaced by a stand-in
+that waits --db-latency seconds and returns a quoter with --items line
+items, so the run measures the HTTP, admission and serialization work of
+the workers alone. The stand-in is installed with a sitecustomize module,
+which every worker process runs before importing the app. With
+--mongodb-url a quoter is stored in that database and read through the
+real gateway. Run from the repository root with the service environment
+variables set:
+
+    python scripts/bench_workers.py --workers 1 2 4 8 --duration 10
+    python scripts/bench_workers.py --mongodb-url mongodb://localhost:27017
+
+Keep the client processes below the free cores, the load generator shares
+the machine with the workers.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from typing import List
+
+STUB_ENV = "BENCH_WORKERS_STUB"
+LATENCY_ENV = "BENCH_WORKERS_DB_LATENCY"
+ITEMS_ENV = "BENCH_WORKERS_ITEMS"
+SITECUSTOMIZE = """\
+import os
+
+if os.environ.get("{stub_env}"):
+    from bench_workers import install_stub
+    install_stub()
+"""
+
+
+def build_quoter(items: int) -> dict:
+    from fastapi.encoders import jsonable_encoder
+
+    from app.entities.models import QuoterModel
+
+    quoter = QuoterModel(
+        name="Instalacion",
+        date=datetime.utcnow(),
+        subtotal=1000.0,
+        iva=160.0,
+        total=1160.0,
+        percentage_in_advance_pay=50.0,
+        revenue_percentage=30.0,
+        first_pay=580.0,
+        second_pay=580.0,
+        description="Instalacion de equipos",
+        client={
+            "name": "Cliente",
+            "location": "CDMX",
+            "email": "cliente@example.com",
+            "phone_number": 5512345678
+        },
+        services=[
+            {
+                "name": "Mantenimiento",
+                "description": "Mantenimiento preventivo y correctivo",
+                "client_price": 522.0,
+                "real_price": 200.0
+            }
+        ] * items
+    )
+    return jsonable_encoder(quoter)
+
+
+class StubGateway:
+    """Answers the reads the benchmark sends without a database"""
+
+    def __init__(self, latency: float, quoter: dict):
+        self.latency = latency
+        self.quoter = quoter
+
+    async def get_quoter(self, quoter_id: str, include_archived=False):
+        await asyncio.sleep(self.latency)
+        return self.quoter
+
+
+def install_stub():
+    # Runs in every process started by python -m app
+    from app.business import main
+
+    main.gateway = StubGateway(
+        float(os.environ[LATENCY_ENV]),
+        build_quoter(int(os.environ[ITEMS_ENV]))
+    )
+    main.app.router.on_startup.remove(main.create_indexes)
+
+
+def store_quoter(mongodb_url: str, items: int) -> str:
+    from pymongo import MongoClient
+
+    from app.config import Config
+
+    conf = Config(mongodb_url=mongodb_url)
+    quoter = build_quoter(items)
+    client = MongoClient(mongodb_url)
+    client[conf.mongo_db][conf.quoters_collec].insert_one(quoter)
+    client.close()
+    return quoter["_id"]
+
+
+def with_settings(env: dict, **settings) -> dict:
+    # Settings are read case-insensitively, drop any other spelling
+    names = {name.lower() for name in settings}
+    return {
+        **{key: value for key, value in env.items()
+           if key.lower() not in names},
+        **{name.upper(): str(value) for name, value in settings.items()}
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def load(port: int, path: str, connections: int, until: float):
+    request = (
+        f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+    ).encode("utf-8")
+
+    async def connection() -> List[int]:
+        served = failed = 0
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        while time.perf_counter() < until:
+            writer.write(request)
+            if await read_response(reader) == 200:
+                served += 1
+            else:
+                failed += 1
+        writer.close()
+        return [served, failed]
+
+    results = await asyncio.gather(
+        *(connection() for _ in range(connections))
+    )
+    return [sum(column) for column in zip(*results)]
+
+
+def run_client(port: int, path: str, connections: int, until: float):
+    return asyncio.run(load(port, path, connections, until))
+
+
+def wait_ready(port: int, path: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), 1):
+                pass
+        except OSError:
+            time.sleep(0.2)
+            continue
+        served, _ = run_client(port, path, 1, time.perf_counter() + 0.5)
+        if served:
+            return
+    raise RuntimeError("The API did not start in time")
+
+
+def bench(workers: int, args, env: dict, path: str) -> List[float]:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app"],
+        env=with_settings(
+            env,
+            server_host="127.0.0.1",
+            server_port=port,
+            server_workers=workers
+        ),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(port, path)
+        until = time.perf_counter() + args.duration
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.starmap(
+                run_client,
+                [(port, path, args.connections, until)] * args.clients
+            )
+        served, failed = (sum(column) for column in zip(*results))
+    finally:
+        server.terminate()
+        server.wait()
+    return [served / args.duration, failed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    parser.add_argument("--mongodb-url")
+    args = parser.parse_args()
+    scripts = os.path.dirname(os.path.abspath(__file__))
+    root = os.path.dirname(scripts)
+    env = {**os.environ}
+    with tempfile.TemporaryDirectory() as sitecustomize_dir:
+        if args.mongodb_url:
+            env = with_settings(env, mongodb_url=args.mongodb_url)
+            quoter_id = store_quoter(args.mongodb_url, args.items)
+            source = f"mongodb at {args.mongodb_url}"
+        else:
+            with open(
+                os.path.join(sitecustomize_dir, "sitecustomize.py"), "w"
+            ) as sitecustomize:
+                sitecustomize.write(SITECUSTOMIZE.format(stub_env=STUB_ENV))
+            env[STUB_ENV] = "1"
+            env[LATENCY_ENV] = str(args.db_latency)
+            env[ITEMS_ENV] = str(args.items)
+            quoter_id = "stub"
+            source = f"stand-in gateway, {args.db_latency * 1000:.1f} ms"
+        env["PYTHONPATH"] = os.pathsep.join(
+            [sitecustomize_dir, scripts, root, env.get("PYTHONPATH", "")]
+        )
+        path = f"/api/v1/quoters/{quoter_id}"
+        print(
+            f"{source}, {args.items} line items, {args.clients} clients x "
+            f"{args.connections} connections, {os.cpu_count()} CPUs"
+        )
+        for workers in args.workers:
+            per_second, failed = bench(workers, args, env, path)
+            print(
+                f"{workers:>3} workers: {per_second:10.0f} req/s "
+                f"{failed:>6} failed"
+            )
+
+
+if __name__ == "__main__":
+    main()
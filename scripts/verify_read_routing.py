@@ -0,0 +1,130 @@
+"""Check which deployment members serve the quoter reads
+
+Runs the search, list and lookup reads of the Repository against the
+configured deployment and records, with a command listener, the member
+that served every command and the read preference sent with it. Search
+and list reads should follow SEARCH_READ_PREFERENCE, lookups must stay
+on the primary. On a sharded cluster the commands go to mongos, so the
+members cannot be told apart from the driver; there the check is that
+the hedge option is sent when SEARCH_HEDGED_READS is set.
+
+Needs a replica set (e.g. three local members started with
+--replSet rs0) or a sharded cluster. Run from the repository root with
+the service environment variables set:
+
+    SEARCH_READ_PREFERENCE=secondary python scripts/verify_read_routing.py
+
+Exits with status 1 when a read was routed to the wrong member.
+"""
+import sys
+import asyncio
+from typing import List, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from app.config import Config
+from app.errors import ElementNotFoundError
+from app.entities.models import QuoterQueryModel
+from app.infrastructure.repository import Repository
+
+READ_COMMANDS = {"find", "aggregate"}
+
+
+class ReadRecorder(monitoring.CommandListener):
+
+    def __init__(self):
+        self.reads: List[Tuple[str, Tuple[str, int], dict]] = []
+
+    def started(self, event):
+        if event.command_name in READ_COMMANDS:
+            self.reads.append(
+                (
+                    event.command_name,
+                    event.connection_id,
+                    event.command.get("$readPreference", {})
+                )
+            )
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def record(recorder: ReadRecorder, read) -> list:
+    recorder.reads.clear()
+    try:
+        await read()
+    except ElementNotFoundError:
+        pass
+    return list(recorder.reads)
+
+
+async def verify(conf: Config) -> bool:
+    recorder = ReadRecorder()
+    client = AsyncIOMotorClient(conf.mongodb_url, event_listeners=[recorder])
+    await client.admin.command("ping")
+    repository = Repository(client[conf.mongo_db], None, conf)
+    primary = client.primary
+    secondaries = client.secondaries
+    sharded = client.is_mongos
+    print(f"mongos: {sharded} primary: {primary} secondaries: {secondaries}")
+    searches = {
+        "search": lambda: repository.search_quoter_by_content("a"),
+        "list": repository.get_quoters,
+        "query": lambda: repository.query_quoters(QuoterQueryModel()),
+    }
+    lookups = {
+        "lookup": lambda: repository.get_quoter(str(ObjectId())),
+    }
+    if sharded:
+        expected = "mongos"
+    elif conf.search_read_preference == "secondary":
+        expected = "secondary"
+    elif conf.search_read_preference == "primary":
+        expected = "primary"
+    else:
+        # The other modes may pick either member
+        expected = None
+    ok = True
+    for reads, wanted in ((searches, expected), (lookups, "primary")):
+        for name, read in reads.items():
+            for command, address, read_preference in await record(
+                recorder,
+                read
+            ):
+                if sharded:
+                    member = "mongos"
+                elif address == primary:
+                    member = "primary"
+                elif address in secondaries:
+                    member = "secondary"
+                else:
+                    member = "unknown"
+                routed = wanted is None or member == wanted
+                if sharded and reads is searches:
+                    hedge = read_preference.get("hedge", {})
+                    routed = routed and (
+                        hedge.get("enabled", False)
+                        == conf.search_hedged_reads
+                    )
+                ok = ok and routed
+                print(
+                    f"{'ok' if routed else 'WRONG':>5} {name:>6} "
+                    f"{command:>9} {address} {member} {read_preference}"
+                )
+    client.close()
+    return ok
+
+
+def main():
+    conf = Config()
+    if not asyncio.run(verify(conf)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+
+class MemoryCollection:
+    """In-memory stand-in of the Motor collection calls the stores make
+
+    Queries only match by equality on top level fields and updates only
+    support ``$set``, which is all the idempotency claims need.
+    """
+
+    def __init__(self):
+        self.documents: Dict[Any, Dict[str, Any]] = {}
+
+    def _find(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for document in self.documents.values():
+            if all(document.get(name) == value
+                   for name, value in query.items()):
+                return document
+        return None
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def insert_one(self, document: Dict[str, Any]):
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError(f"Duplicate key: {document['_id']}")
+        self.documents[document["_id"]] = dict(document)
+
+    async def find_one(self, query: Dict[str, Any]):
+        document = self._find(query)
+        return dict(document) if document is not None else None
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any]):
+        document = self._find(query)
+        if document is not None:
+            document.update(update["$set"])
+        return SimpleNamespace(modified_count=int(document is not None))
+
+    async def delete_one(self, query: Dict[str, Any]):
+        document = self._find(query)
+        if document is not None:
+            del self.documents[document["_id"]]
+        return SimpleNamespace(deleted_count=int(document is not None))
+
+
+@pytest.fixture
+def memory_collection():
+    return MemoryCollection()
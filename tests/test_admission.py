@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.errors import OverloadedError
+from app.business.admission import AdmissionController, RouteClass
+
+
+def build_controller(concurrency=1, max_queue=10, max_wait=1.0, **limits):
+    return AdmissionController(
+        concurrency,
+        max_queue,
+        max_wait,
+        {RouteClass[route]: limit for route, limit in limits.items()}
+    )
+
+
+def test_full_queue_is_rejected():
+    async def scenario():
+        admission = build_controller(max_queue=1)
+        await admission.acquire(RouteClass.read)
+        waiting = asyncio.create_task(admission.acquire(RouteClass.read))
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError):
+            await admission.acquire(RouteClass.read)
+        admission.release(RouteClass.read)
+        await waiting
+
+    asyncio.run(scenario())
+
+
+def test_waiters_are_admitted_by_priority():
+    async def scenario():
+        admission = build_controller()
+        admitted = []
+
+        async def request(route: RouteClass):
+            await admission.acquire(route)
+            admitted.append(route)
+            admission.release(route)
+
+        await admission.acquire(RouteClass.read)
+        requests = [
+            asyncio.create_task(request(route))
+            for route in (RouteClass.search, RouteClass.read,
+                          RouteClass.write)
+        ]
+        await asyncio.sleep(0)
+        admission.release(RouteClass.read)
+        await asyncio.gather(*requests)
+        return admitted
+
+    assert asyncio.run(scenario()) == [
+        RouteClass.write,
+        RouteClass.read,
+        RouteClass.search
+    ]
+
+
+def test_class_limit_does_not_block_other_classes():
+    async def scenario():
+        admission = build_controller(concurrency=3, search=1)
+        await admission.acquire(RouteClass.search)
+        search = asyncio.create_task(admission.acquire(RouteClass.search))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(admission.acquire(RouteClass.read), 0.1)
+        assert not search.done()
+        admission.release(RouteClass.search)
+        await asyncio.wait_for(search, 0.1)
+        return dict(admission._active)
+
+    assert asyncio.run(scenario()) == {
+        RouteClass.write: 0,
+        RouteClass.read: 1,
+        RouteClass.search: 1
+    }
+
+
+def test_timed_out_waiter_leaves_the_queue():
+    async def scenario():
+        admission = build_controller(max_wait=0.01)
+        await admission.acquire(RouteClass.write)
+        with pytest.raises(OverloadedError):
+            await admission.acquire(RouteClass.read)
+        assert admission._waiters == []
+        admission.release(RouteClass.write)
+        await admission.acquire(RouteClass.read)
+        return dict(admission._active)
+
+    assert asyncio.run(scenario())[RouteClass.read] == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        admission = build_controller()
+        await admission.acquire(RouteClass.write)
+        waiting = asyncio.create_task(admission.acquire(RouteClass.read))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert admission._waiters == []
+        admission.release(RouteClass.write)
+        return sum(admission._active.values())
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,160 @@
+"""Moving old and sold quoters to the archive
+
+Runs on a throwaway database of the MongoDB at ``mongodb_url`` and is
+skipped when it is not reachable.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.entities.models import QuoterModel, QuoterUpdateModel, SellModel
+from app.errors import InsertionError
+
+
+@pytest.fixture
+def conf(settings):
+    conf = settings.copy(update={"archive_quoters_collec": "quoters_archive"})
+    client = MongoClient(conf.mongodb_url, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except ConnectionFailure:
+        pytest.skip(f"MongoDB not reachable at {conf.mongodb_url}")
+    client.drop_database(conf.mongo_db)
+    yield conf
+    client.drop_database(conf.mongo_db)
+    client.close()
+
+
+def build_quoter(quoter_date: datetime) -> QuoterModel:
+    return QuoterModel(
+        name="Instalacion",
+        date=quoter_date,
+        subtotal=1000.0,
+        iva=160.0,
+        total=1160.0,
+        percentage_in_advance_pay=50.0,
+        revenue_percentage=30.0,
+        first_pay=580.0,
+        second_pay=580.0,
+        description="Instalacion de equipos",
+        client={
+            "name": "Cliente",
+            "location": "CDMX",
+            "email": "cliente@example.com",
+            "phone_number": 5512345678
+        }
+    )
+
+
+def run_with_repository(conf, scenario, updates: int = 0):
+    from app.infrastructure.repository import Repository
+
+    class UpdatedWhileMoved(Repository):
+        """Updates the quoters right before the first moves delete them"""
+
+        async def _move_to_archive(self, quoters):
+            nonlocal updates
+            if updates:
+                updates -= 1
+                await self.nosql_conn[conf.quoters_collec].update_many(
+                    {"_id": {"$in": [quoter["_id"] for quoter in quoters]}},
+                    {"$set": {"updated_at": datetime.utcnow().isoformat()}}
+                )
+            return await super()._move_to_archive(quoters)
+
+    async def run():
+        client = AsyncIOMotorClient(conf.mongodb_url)
+        try:
+            repository = UpdatedWhileMoved(
+                client[conf.mongo_db],
+                None,
+                conf
+            )
+            return await scenario(repository)
+        finally:
+            client.close()
+
+    return asyncio.run(run())
+
+
+def archive_ages(now: datetime):
+    return (
+        (now - timedelta(days=180)).isoformat(),
+        (now - timedelta(days=30)).isoformat()
+    )
+
+
+def test_patched_old_quoter_is_archived(conf):
+    now = datetime.utcnow()
+
+    async def scenario(repository):
+        quoter = await repository.insert_quoter(build_quoter(now))
+        await repository.update_quoter(
+            quoter["_id"],
+            QuoterUpdateModel(date=now - timedelta(days=400))
+        )
+        archived = await repository.archive_quoters(*archive_ages(now))
+        database = repository.nosql_conn
+        hot = await database[conf.quoters_collec].find_one(
+            {"_id": quoter["_id"]}
+        )
+        stored = await database[conf.archive_quoters_collec].find_one(
+            {"_id": quoter["_id"]}
+        )
+        return archived, hot, stored
+
+    archived, hot, stored = run_with_repository(conf, scenario)
+    assert archived == 1
+    assert hot is None
+    assert stored is not None
+
+
+def sold_quoter_scenario(conf, now: datetime):
+    async def scenario(repository):
+        quoter = await repository.insert_quoter(build_quoter(now))
+        await repository.create_sell(
+            SellModel(date=now - timedelta(days=60), quoter_id=quoter["_id"])
+        )
+        try:
+            archived = await repository.archive_quoters(*archive_ages(now))
+        except InsertionError:
+            archived = None
+        database = repository.nosql_conn
+        hot = await database[conf.quoters_collec].find_one(
+            {"_id": quoter["_id"]}
+        )
+        stored = await database[conf.archive_quoters_collec].find_one(
+            {"_id": quoter["_id"]}
+        )
+        return archived, hot, stored
+
+    return scenario
+
+
+def test_sold_quoter_updated_while_moved_is_archived(conf):
+    now = datetime.utcnow()
+    archived, hot, stored = run_with_repository(
+        conf,
+        sold_quoter_scenario(conf, now),
+        updates=1
+    )
+    assert archived == 1
+    assert hot is None
+    # The archive holds the version written meanwhile
+    assert stored["updated_at"] > now.isoformat()
+
+
+def test_sold_quoter_always_updated_fails_the_run(conf):
+    now = datetime.utcnow()
+    archived, hot, stored = run_with_repository(
+        conf,
+        sold_quoter_scenario(conf, now),
+        updates=10
+    )
+    # The caller keeps its checkpoint and walks the same sales again
+    assert archived is None
+    assert hot is not None
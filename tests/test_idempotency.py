@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.errors import IdempotencyKeyError
+from app.infrastructure.idempotency import DONE, IN_FLIGHT, IdempotencyStore
+
+
+def build_store(collection=None) -> IdempotencyStore:
+    return IdempotencyStore(
+        ttl_seconds=60,
+        max_keys=100,
+        collection=collection,
+        claim_seconds=30,
+        poll_interval=0.01
+    )
+
+
+class Operation:
+    """Counts its runs and waits for ``release`` before answering"""
+
+    def __init__(self, response, released: bool = True):
+        self.response = response
+        self.calls = 0
+        self.release = asyncio.Event()
+        if released:
+            self.release.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.response
+
+
+def test_concurrent_duplicates_run_once():
+    async def scenario():
+        store = build_store()
+        operation = Operation({"_id": "q1"}, released=False)
+        first = asyncio.create_task(store.run("key", "hash", operation))
+        second = asyncio.create_task(store.run("key", "hash", operation))
+        await asyncio.sleep(0)
+        operation.release.set()
+        return await asyncio.gather(first, second), operation.calls
+
+    responses, calls = asyncio.run(scenario())
+    assert responses == [{"_id": "q1"}, {"_id": "q1"}]
+    assert calls == 1
+
+
+def test_waiter_takes_over_when_the_owner_is_cancelled(memory_collection):
+    async def scenario():
+        store = build_store(memory_collection)
+        owner_operation = Operation({"_id": "owner"}, released=False)
+        waiter_operation = Operation({"_id": "waiter"})
+        owner = asyncio.create_task(
+            store.run("key", "hash", owner_operation)
+        )
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(
+            store.run("key", "hash", waiter_operation)
+        )
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        response = await waiter
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return response, owner_operation.calls, waiter_operation.calls
+
+    response, owner_calls, waiter_calls = asyncio.run(scenario())
+    assert response == {"_id": "waiter"}
+    assert (owner_calls, waiter_calls) == (1, 1)
+    assert memory_collection.documents["key"]["state"] == DONE
+
+
+def test_key_reused_with_another_body_is_rejected(memory_collection):
+    async def scenario():
+        store = build_store(memory_collection)
+        other_worker = build_store(memory_collection)
+        operation = Operation({"_id": "q1"})
+        await store.run("key", "hash", operation)
+        for replaying_store in (store, other_worker):
+            with pytest.raises(IdempotencyKeyError):
+                await replaying_store.run("key", "other hash", operation)
+        return operation.calls
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_other_worker_waits_for_the_claim_and_replays(memory_collection):
+    async def scenario():
+        worker = build_store(memory_collection)
+        other_worker = build_store(memory_collection)
+        operation = Operation({"_id": "q1"}, released=False)
+        other_operation = Operation({"_id": "q2"})
+        first = asyncio.create_task(worker.run("key", "hash", operation))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(
+            other_worker.run("key", "hash", other_operation)
+        )
+        await asyncio.sleep(0.05)
+        assert memory_collection.documents["key"]["state"] == IN_FLIGHT
+        operation.release.set()
+        return await asyncio.gather(first, second), other_operation.calls
+
+    responses, other_calls = asyncio.run(scenario())
+    assert responses == [{"_id": "q1"}, {"_id": "q1"}]
+    assert other_calls == 0
+
+
+def test_stale_claim_is_taken_over(memory_collection):
+    memory_collection.documents["key"] = {
+        "_id": "key",
+        "state": IN_FLIGHT,
+        "claim": "dead worker",
+        "body_hash": "hash",
+        "created_at": datetime.utcnow() - timedelta(minutes=5)
+    }
+
+    async def scenario():
+        operation = Operation({"_id": "q1"})
+        store = build_store(memory_collection)
+        return await store.run("key", "hash", operation), operation.calls
+
+    response, calls = asyncio.run(scenario())
+    assert response == {"_id": "q1"}
+    assert calls == 1
+    assert memory_collection.documents["key"]["state"] == DONE
+
+
+def test_failed_operation_releases_the_key(memory_collection):
+    async def failing():
+        raise RuntimeError("DB down")
+
+    async def scenario():
+        store = build_store(memory_collection)
+        with pytest.raises(RuntimeError):
+            await store.run("key", "hash", failing)
+        assert "key" not in memory_collection.documents
+        return await store.run("key", "hash", Operation({"_id": "q1"}))
+
+    assert asyncio.run(scenario()) == {"_id": "q1"}
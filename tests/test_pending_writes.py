@@ -0,0 +1,62 @@
+from app.infrastructure.pending_writes import PendingWrites
+
+
+def quoter(version, name="Quoter"):
+    return {"_id": "q1", "name": name, "updated_at": version}
+
+
+def test_pending_version_wins_over_an_older_db_version():
+    pending_writes = PendingWrites(60, 10)
+    pending_writes.add_quoter(quoter("2023-05-01T10:00:01", "Pending"))
+    observed = pending_writes.observe_quoter(quoter("2023-05-01T10:00:00"))
+    assert observed["name"] == "Pending"
+    assert pending_writes.quoter("q1") is not None
+
+
+def test_equal_or_newer_db_version_wins_and_drops_the_entry():
+    for db_version in ("2023-05-01T10:00:00", "2023-05-01T10:00:01"):
+        pending_writes = PendingWrites(60, 10)
+        pending_writes.add_quoter(quoter("2023-05-01T10:00:00", "Pending"))
+        observed = pending_writes.observe_quoter(quoter(db_version, "DB"))
+        assert observed["name"] == "DB"
+        assert pending_writes.quoter("q1") is None
+
+
+def test_db_quoter_without_version_is_older():
+    pending_writes = PendingWrites(60, 10)
+    pending_writes.add_quoter(quoter("2023-05-01T10:00:00", "Pending"))
+    observed = pending_writes.observe_quoter(quoter(None, "DB"))
+    assert observed["name"] == "Pending"
+
+
+def test_versions_with_timezones_are_compared_in_utc():
+    pending_writes = PendingWrites(60, 10)
+    pending_writes.add_quoter(quoter("2023-05-01T10:00:00", "Pending"))
+    # Same instant written by another client
+    observed = pending_writes.observe_quoter(
+        quoter("2023-05-01T04:00:00-06:00", "DB")
+    )
+    assert observed["name"] == "DB"
+    pending_writes.add_quoter(quoter("2023-05-01T10:00:00", "Pending"))
+    observed = pending_writes.observe_quoter(
+        quoter("2023-05-01T09:59:59Z", "DB")
+    )
+    assert observed["name"] == "Pending"
+
+
+def test_expired_and_evicted_entries_are_dropped():
+    expired = PendingWrites(-1, 10)
+    expired.add_quoter(quoter("2023-05-01T10:00:00"))
+    assert expired.quoters() == []
+    bounded = PendingWrites(60, 2)
+    for number in range(3):
+        bounded.add_quoter({"_id": f"q{number}", "updated_at": None})
+    assert [entry["_id"] for entry in bounded.quoters()] == ["q1", "q2"]
+
+
+def test_observed_sale_drops_the_pending_sale():
+    pending_writes = PendingWrites(60, 10)
+    pending_writes.add_sale({"_id": "s1", "quoter_id": "q1"})
+    assert pending_writes.sale_by_quoter("q1")["_id"] == "s1"
+    pending_writes.observe_sale("q1")
+    assert pending_writes.sale_by_quoter("q1") is None
@@ -0,0 +1,21 @@
+import os
+
+from app.profiling import Profile, ProfileStore
+
+
+def test_list_skips_profiles_pruned_meanwhile(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path), 10)
+    profile = Profile("GET", "/api/v1/quoters")
+    store.save(profile)
+    listdir = os.listdir
+    # A concurrent save removes this one between listdir and stat
+    monkeypatch.setattr(
+        os,
+        "listdir",
+        lambda path: [*listdir(path), "pruned.json"]
+    )
+    assert [entry["id"] for entry in store.list()] == [profile.id]
+
+
+def test_list_without_directory_is_empty(tmp_path):
+    assert ProfileStore(str(tmp_path / "missing"), 10).list() == []
@@ -0,0 +1,145 @@
+"""Every filter combination of the quoter query must be served by an index
+
+Runs ``explain`` on a throwaway database of the MongoDB at ``mongodb_url``
+and is skipped when it is not reachable.
+"""
+import asyncio
+import itertools
+from datetime import date, datetime
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.entities.models import (
+    QuoterQueryModel,
+    QuoterSortField,
+    SortOrder
+)
+
+FILTERS = {
+    "date_from": datetime(2023, 1, 1),
+    "date_to": date(2023, 6, 30),
+    "client_email": "client3@example.com",
+    "client_name": "Client 1",
+    "total_min": 100.0,
+    "total_max": 5000.0,
+    "sold": True,
+}
+PATCHED_QUOTER = "quoter-7"
+PATCHED_DATE = datetime(2023, 3, 15, 12, 30)
+
+
+@pytest.fixture(scope="module")
+def database(settings):
+    conf = settings
+    client = MongoClient(conf.mongodb_url, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except ConnectionFailure:
+        pytest.skip(f"MongoDB not reachable at {conf.mongodb_url}")
+    client.drop_database(conf.mongo_db)
+    database = client[conf.mongo_db]
+    database[conf.quoters_collec].insert_many(
+        [
+            {
+                "_id": f"quoter-{number}",
+                "name": f"Quoter {number}",
+                "date": datetime(2023, 1 + number % 12, 1).isoformat(),
+                "total": float(number % 50) * 100,
+                "client": {
+                    "name": f"Client {number % 20}",
+                    "email": f"client{number % 20}@example.com"
+                }
+            }
+            for number in range(500)
+        ]
+    )
+    asyncio.run(prepare(conf))
+    yield database
+    client.drop_database(conf.mongo_db)
+    client.close()
+
+
+async def prepare(conf):
+    from app.entities.models import QuoterUpdateModel
+    from app.infrastructure.repository import Repository
+
+    client = AsyncIOMotorClient(conf.mongodb_url)
+    try:
+        repository = Repository(client[conf.mongo_db], None, conf)
+        await repository.create_indexes()
+        # Patched quoters must store their dates like inserted ones
+        await repository.update_quoter(
+            PATCHED_QUOTER,
+            QuoterUpdateModel(date=PATCHED_DATE)
+        )
+    finally:
+        client.close()
+
+
+def filter_combinations():
+    names = list(FILTERS)
+    for size in range(len(names) + 1):
+        for combination in itertools.combinations(names, size):
+            sorts = itertools.product(QuoterSortField, SortOrder)
+            for sort_by, order in sorts:
+                yield QuoterQueryModel(
+                    **{name: FILTERS[name] for name in combination},
+                    sort_by=sort_by,
+                    order=order
+                )
+
+
+def test_no_filter_combination_scans_the_collection(settings, database):
+    from app.infrastructure.repository import Repository
+
+    conf = settings
+    repository = Repository(database, None, conf)
+    for query in filter_combinations():
+        pipeline = repository.quoter_query_pipeline(query, query.page_size)
+        explain = database.command(
+            "explain",
+            {
+                "aggregate": conf.quoters_collec,
+                "pipeline": pipeline,
+                "cursor": {}
+            },
+            verbosity="queryPlanner"
+        )
+        # Only the winning plans, rejected plans may scan
+        winning_plans = [
+            str(stage)
+            for stage in _find_key(explain, "winningPlan")
+        ]
+        assert winning_plans, explain
+        assert all("COLLSCAN" not in plan for plan in winning_plans), (
+            query,
+            winning_plans
+        )
+
+
+def test_patched_quoter_matches_date_filters(settings, database):
+    from app.infrastructure.repository import Repository
+
+    repository = Repository(database, None, settings)
+    query = QuoterQueryModel(
+        date_from=PATCHED_DATE.date(),
+        date_to=PATCHED_DATE.date()
+    )
+    pipeline = repository.quoter_query_pipeline(query, query.page_size)
+    found = database[settings.quoters_collec].aggregate(pipeline)
+    assert [quoter["_id"] for quoter in found] == [PATCHED_QUOTER]
+
+
+def _find_key(document, key):
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            else:
+                yield from _find_key(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from _find_key(value, key)